@@ -0,0 +1,122 @@
+from collections import deque
+from typing import Dict, List, Sequence, Tuple
+
+# Per-alias scan result: quantity written before the first qualifying mention
+# ("2 pizza", "2x pizza") and after it ("pizza 2", "pizza x 2"); None if absent.
+AliasHit = Tuple[int | None, int | None]
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def _is_boundary(text: str, pos: int) -> bool:
+    # Same rule as the regex \b assertion.
+    before = pos > 0 and _is_word_char(text[pos - 1])
+    after = pos < len(text) and _is_word_char(text[pos])
+    return before != after
+
+
+def _quantity_before(text: str, start: int) -> int | None:
+    # Mirrors r"(\d+)\s*(?:x\s*)?<alias>" read right-to-left.
+    pos = start
+    while pos > 0 and text[pos - 1].isspace():
+        pos -= 1
+    if pos > 0 and text[pos - 1] == "x":
+        pos -= 1
+        while pos > 0 and text[pos - 1].isspace():
+            pos -= 1
+
+    end = pos
+    while pos > 0 and text[pos - 1].isdecimal():
+        pos -= 1
+    if pos == end:
+        return None
+    return int(text[pos:end])
+
+
+def _quantity_after(text: str, end: int) -> int | None:
+    # Mirrors r"<alias>\s*(?:x\s*)?(\d+)".
+    size = len(text)
+    pos = end
+    while pos < size and text[pos].isspace():
+        pos += 1
+    if pos < size and text[pos] == "x":
+        pos += 1
+        while pos < size and text[pos].isspace():
+            pos += 1
+
+    start = pos
+    while pos < size and text[pos].isdecimal():
+        pos += 1
+    if pos == start:
+        return None
+    return int(text[start:pos])
+
+
+# Aho-Corasick automaton that finds every word-bounded alias mention in one scan.
+class AliasMatcher:
+    def __init__(self, aliases: Sequence[str]) -> None:
+        self.aliases = tuple(aliases)
+        self._lengths = tuple(len(alias) for alias in self.aliases)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+
+        pending_out: List[List[int]] = [[]]
+        for index, alias in enumerate(self.aliases):
+            state = 0
+            for ch in alias:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    pending_out.append([])
+                state = next_state
+            pending_out[state].append(index)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(ch, 0)
+                pending_out[next_state].extend(pending_out[self._fail[next_state]])
+
+        self._out = [tuple(indices) for indices in pending_out]
+
+    def scan(self, text: str) -> Dict[int, AliasHit]:
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        lengths = self._lengths
+
+        hits: Dict[int, List[int | None]] = {}
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state]:
+                continue
+
+            end = pos + 1
+            for index in out[state]:
+                start = end - lengths[index]
+                if not (_is_boundary(text, start) and _is_boundary(text, end)):
+                    continue
+
+                hit = hits.get(index)
+                if hit is None:
+                    hit = hits[index] = [None, None]
+                if hit[0] is None:
+                    hit[0] = _quantity_before(text, start)
+                if hit[1] is None:
+                    hit[1] = _quantity_after(text, end)
+
+        return {index: (left, right) for index, (left, right) in hits.items()}
@@ -0,0 +1,277 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Hashable, Iterable, Tuple
+
+from app.retrieval import TOKEN_PATTERN
+from app.vector_index import HashingVectorizer, dense_available
+
+try:
+    import numpy as np
+except ImportError:  # The semantic cache is disabled without numpy; exact-match caching still works.
+    np = None
+
+# Case, spacing and sentence punctuation never change what the model is asked.
+# Every other character is kept so non-Latin questions do not collapse together.
+QUESTION_WORD_PATTERN = re.compile(r"[^\s?!.,;:]+")
+
+
+# "not", "no", "without" and n't contractions ("don't" splits into "don" and "t")
+# barely move an n-gram vector but flip what is being asked.
+NEGATION_WORDS = frozenset(
+    {
+        "no",
+        "not",
+        "never",
+        "nor",
+        "none",
+        "nothing",
+        "without",
+        "cannot",
+        "t",
+        "dont",
+        "doesnt",
+        "didnt",
+        "isnt",
+        "arent",
+        "wasnt",
+        "werent",
+        "cant",
+        "couldnt",
+        "wont",
+        "wouldnt",
+        "havent",
+        "hasnt",
+    }
+)
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(QUESTION_WORD_PATTERN.findall(question.lower()))
+
+
+def context_hash(context_text: str) -> str:
+    return hashlib.sha256(context_text.encode("utf-8")).hexdigest()
+
+
+def answer_cache_key(question: str, context_text: str, model_name: str) -> Tuple[str, str, str]:
+    return normalize_question(question), context_hash(context_text), model_name
+
+
+# LRU + TTL cache of model answers. Entries belong to one knowledge-base
+# version; bind() drops everything when the knowledge base is reloaded.
+class AnswerCache:
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: object = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def bind(self, version: object) -> None:
+        with self._lock:
+            if version == self._version:
+                return
+            if self._entries:
+                self.invalidations += 1
+                self._entries.clear()
+            self._version = version
+
+    def get(self, key: Hashable) -> str | None:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, answer = entry
+            if self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def put(self, key: Hashable, answer: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+# Answers reused across paraphrases. Questions are embedded with the local
+# hashing vectorizer and compared only against entries that were answered from
+# the same retrieved context by the same model, so a near-duplicate question
+# about a different dish or section never matches. The similarities of recent
+# hits are kept (without the questions, which stats() exposes) so the threshold
+# can be checked against real traffic.
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        threshold: float,
+        vectorizer: HashingVectorizer | None = None,
+        stop_words: Iterable[str] = (),
+        audit_size: int = 20,
+    ) -> None:
+        self.max_entries = max_entries if dense_available() else 0
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.vectorizer = vectorizer or HashingVectorizer()
+        self.stop_words = frozenset(stop_words)
+        self._lock = threading.Lock()
+        self._version: object = None
+        self._matrix = np.zeros((self.max_entries, self.vectorizer.dimensions), dtype=np.float32) if self.enabled else None
+        # slot -> (group, normalized question, answer, stored_at), least recently used first.
+        self._slots: "OrderedDict[int, Tuple[Hashable, str, str, float]]" = OrderedDict()
+        self._groups: Dict[Hashable, Dict[str, int]] = {}
+        self._free = list(range(self.max_entries - 1, -1, -1))
+        self._lookup_us: Deque[float] = deque(maxlen=1024)
+        self.audit_similarities: Deque[float] = deque(maxlen=audit_size)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _embedding_text(self, question: str) -> str:
+        # Filler words ("do", "you", "the") would otherwise dominate short questions.
+        words = [token for token in TOKEN_PATTERN.findall(question.lower()) if token not in self.stop_words]
+        return " ".join(words) or question
+
+    def _negations(self, question: str) -> int:
+        return sum(token in NEGATION_WORDS for token in TOKEN_PATTERN.findall(question.lower()))
+
+    def _release(self, slot: int) -> None:
+        group, normalized, _, _ = self._slots.pop(slot)
+        members = self._groups[group]
+        del members[normalized]
+        if not members:
+            del self._groups[group]
+        self._free.append(slot)
+
+    def bind(self, version: object) -> None:
+        with self._lock:
+            if version == self._version:
+                return
+            if self._slots:
+                self.invalidations += 1
+                for slot in list(self._slots):
+                    self._release(slot)
+            self._version = version
+
+    def lookup(self, question: str, group: Hashable) -> str | None:
+        if not self.enabled:
+            return None
+        started = time.perf_counter()
+        # "is it spicy" and "is it not spicy" score about 0.9; only questions with
+        # as many negations as the incoming one are candidates.
+        group = (group, self._negations(question))
+        with self._lock:
+            try:
+                members = self._groups.get(group)
+                if not members:
+                    self.misses += 1
+                    return None
+
+                now = time.monotonic()
+                slots = []
+                for slot in list(members.values()):
+                    if self.ttl_seconds > 0 and now - self._slots[slot][3] > self.ttl_seconds:
+                        self._release(slot)
+                    else:
+                        slots.append(slot)
+                if not slots:
+                    self.misses += 1
+                    return None
+
+                # Scoring every row and then picking the group's slots beats gathering the rows first.
+                vector = self.vectorizer.transform([self._embedding_text(question)])[0]
+                similarities = (self._matrix @ vector)[np.fromiter(slots, dtype=np.intp, count=len(slots))]
+                best = int(np.argmax(similarities))
+                similarity = float(similarities[best])
+                if similarity < self.threshold:
+                    self.misses += 1
+                    return None
+
+                slot = slots[best]
+                self._slots.move_to_end(slot)
+                answer = self._slots[slot][2]
+                self.hits += 1
+                self.audit_similarities.append(round(similarity, 4))
+                return answer
+            finally:
+                self._lookup_us.append((time.perf_counter() - started) * 1e6)
+
+    def put(self, question: str, group: Hashable, answer: str) -> None:
+        if not self.enabled:
+            return
+        normalized = normalize_question(question)
+        vector = self.vectorizer.transform([self._embedding_text(question)])[0]
+        group = (group, self._negations(question))
+        with self._lock:
+            slot = self._groups.get(group, {}).get(normalized)
+            if slot is not None:
+                self._release(slot)
+            if not self._free:
+                self._release(next(iter(self._slots)))
+                self.evictions += 1
+
+            slot = self._free.pop()
+            self._matrix[slot] = vector
+            self._slots[slot] = (group, normalized, answer, time.monotonic())
+            self._groups.setdefault(group, {})[normalized] = slot
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            latencies = sorted(self._lookup_us)
+            return {
+                "entries": len(self._slots),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "lookup_us_p50": round(latencies[len(latencies) // 2], 1) if latencies else 0.0,
+                "lookup_us_p95": round(latencies[int(len(latencies) * 0.95)], 1) if latencies else 0.0,
+                "audit_similarities": list(self.audit_similarities),
+            }
@@ -0,0 +1,332 @@
+import atexit
+import json
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+LEDGER_PAGE_SIZE = 500
+_STOP = object()
+
+
+class LedgerUnavailableError(RuntimeError):
+    pass
+
+
+def _next_day(day: str) -> str:
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+
+# Every confirmed bill, kept forever in a SQLite database in WAL mode. Rows are
+# only ever inserted: triggers reject UPDATE and DELETE. Requests hand bills to
+# append(), which only queues them; one writer thread commits whatever queued
+# up while its previous commit was syncing, so a burst of checkouts shares one
+# fsync. Bills not yet committed are still visible to get(). append() never
+# blocks, since it runs on the event loop; a writer that cannot reach the file
+# keeps retrying, and reads report LedgerUnavailableError instead of failing.
+#
+# Lookups by bill_id, by session and by date range each use a B-tree index, so
+# they stay O(log n) however many bills accumulate.
+class BillLedger:
+    def __init__(self, path: str, batch_size: int = 256, max_queue: int = 10000) -> None:
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        # Bills waiting beyond max_queue are still committed, but counted as overflows.
+        self.max_queue = max_queue
+        self._queue: "queue.SimpleQueue[object]" = queue.SimpleQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._unflushed: Dict[str, Tuple[str, Dict[str, object]]] = {}
+        self._writer: threading.Thread | None = None
+        self.appended = 0
+        self.committed = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self.commit_seconds = 0.0
+        self.errors = 0
+        self.last_error = ""
+        self.conflicts = 0
+        self.last_conflict = ""
+        self.overflows = 0
+        # The file is created on first use, not here: the module that builds the
+        # ledger is also imported at image build time, as a different user.
+        self._schema_ready = False
+
+    def _create_schema(self, connection: sqlite3.Connection) -> None:
+        with self._lock:
+            if self._schema_ready:
+                return
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS bills (
+                    seq INTEGER PRIMARY KEY,
+                    bill_id TEXT NOT NULL UNIQUE,
+                    session_id TEXT NOT NULL,
+                    issued_at TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    bill TEXT NOT NULL,
+                    recorded_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS bill_conflicts (
+                    seq INTEGER PRIMARY KEY,
+                    bill_id TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    issued_at TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    bill TEXT NOT NULL,
+                    recorded_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS bills_session ON bills (session_id, issued_at);
+                CREATE INDEX IF NOT EXISTS bills_issued_at ON bills (issued_at);
+                CREATE TRIGGER IF NOT EXISTS bills_no_update BEFORE UPDATE ON bills
+                BEGIN SELECT RAISE(ABORT, 'bill ledger is append-only'); END;
+                CREATE TRIGGER IF NOT EXISTS bills_no_delete BEFORE DELETE ON bills
+                BEGIN SELECT RAISE(ABORT, 'bill ledger is append-only'); END;
+                CREATE TRIGGER IF NOT EXISTS bill_conflicts_no_update BEFORE UPDATE ON bill_conflicts
+                BEGIN SELECT RAISE(ABORT, 'bill ledger is append-only'); END;
+                CREATE TRIGGER IF NOT EXISTS bill_conflicts_no_delete BEFORE DELETE ON bill_conflicts
+                BEGIN SELECT RAISE(ABORT, 'bill ledger is append-only'); END;
+                """
+            )
+            self._schema_ready = True
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # A full sync per commit is affordable because commits are batched.
+            connection.execute("PRAGMA synchronous=FULL")
+            self._create_schema(connection)
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _reading(self) -> Iterator[sqlite3.Connection]:
+        try:
+            yield self._connection()
+        except (sqlite3.Error, OSError) as exc:
+            with self._lock:
+                self.errors += 1
+                self.last_error = str(exc)
+            raise LedgerUnavailableError(f"Bill ledger unavailable: {exc}") from exc
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._writer is not None and self._writer.is_alive():
+                return
+            first = self._writer is None
+            self._writer = threading.Thread(target=self._write_forever, name="bill-ledger", daemon=True)
+            writer = self._writer
+        writer.start()
+        if first:
+            # Commits what is still queued when the process exits normally.
+            atexit.register(self.close)
+
+    def append(self, session_id: str, bill: Dict[str, object]) -> None:
+        self._start()
+        with self._lock:
+            self._unflushed[str(bill["bill_id"])] = (session_id, bill)
+            self.appended += 1
+            if len(self._unflushed) > self.max_queue:
+                self.overflows += 1
+                self.errors += 1
+                self.last_error = f"{len(self._unflushed)} bills waiting for the ledger writer"
+        self._queue.put_nowait((session_id, bill))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        # True once every bill appended before the call is committed; False if
+        # that takes longer than timeout (the file is locked or unwritable).
+        if self._writer is None:
+            return True
+        done = threading.Event()
+        self._queue.put_nowait(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 10) -> None:
+        with self._lock:
+            writer = self._writer
+        if writer is None or not writer.is_alive():
+            return
+        self._queue.put(_STOP)
+        writer.join(timeout)
+
+    def _write_forever(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch: List[Tuple[str, Dict[str, object]]] = []
+            markers: List[threading.Event] = []
+            stop = False
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                # Returns only once the batch is committed; see _commit.
+                self._commit(batch)
+            for marker in markers:
+                marker.set()
+            if stop:
+                return
+
+    def _commit(self, batch: List[Tuple[str, Dict[str, object]]]) -> None:
+        delay = 0.05
+        while True:
+            started = time.perf_counter()
+            connection = None
+            try:
+                rows = [
+                    (
+                        str(bill["bill_id"]),
+                        session_id,
+                        str(bill.get("issued_at", "")),
+                        int(bill.get("total", 0) or 0),
+                        json.dumps(bill, separators=(",", ":"), default=str),
+                        time.time(),
+                    )
+                    for session_id, bill in batch
+                ]
+                connection = self._connection()
+                connection.execute("BEGIN IMMEDIATE")
+                conflicts = self._insert(connection, rows)
+                connection.execute("COMMIT")
+                break
+            except Exception as exc:
+                try:
+                    if connection is not None and connection.in_transaction:
+                        connection.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+                # Bills are never dropped and the writer never dies: keep retrying (disk full,
+                # read-only file or directory, database locked) with backoff.
+                with self._lock:
+                    self.errors += 1
+                    self.last_error = str(exc)
+                time.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            if conflicts:
+                self.conflicts += len(conflicts)
+                self.last_conflict = conflicts[-1]
+            for _, bill in batch:
+                self._unflushed.pop(str(bill["bill_id"]), None)
+            self.committed += len(batch)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.commit_seconds += elapsed
+
+    def _insert(self, connection: sqlite3.Connection, rows: List[Tuple[object, ...]]) -> List[str]:
+        # A re-delivered bill (same bill_id, same payload) is a no-op. A different
+        # bill under a bill_id that is already taken (invoice numbers reissued,
+        # e.g. from a lost numbering file) is kept in bill_conflicts and reported,
+        # never dropped.
+        conflicts: List[str] = []
+        for row in rows:
+            inserted = connection.execute(
+                "INSERT OR IGNORE INTO bills (bill_id, session_id, issued_at, total, bill, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                row,
+            ).rowcount
+            if inserted:
+                continue
+            existing = connection.execute("SELECT bill FROM bills WHERE bill_id = ?", (row[0],)).fetchone()
+            if existing is not None and existing[0] == row[4]:
+                continue
+            connection.execute(
+                "INSERT INTO bill_conflicts (bill_id, session_id, issued_at, total, bill, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            conflicts.append(str(row[0]))
+        return conflicts
+
+    def get(self, bill_id: str) -> Tuple[str, Dict[str, object]] | None:
+        with self._lock:
+            pending = self._unflushed.get(bill_id)
+        if pending is not None:
+            return pending
+        with self._reading() as connection:
+            row = connection.execute("SELECT session_id, bill FROM bills WHERE bill_id = ?", (bill_id,)).fetchone()
+        return (row[0], json.loads(row[1])) if row is not None else None
+
+    def for_session(self, session_id: str, limit: int = 50) -> List[Dict[str, object]]:
+        # Newest first; includes bills still waiting for their commit.
+        with self._lock:
+            pending = [bill for owner, bill in self._unflushed.values() if owner == session_id]
+        with self._reading() as connection:
+            rows = connection.execute(
+                "SELECT bill FROM bills WHERE session_id = ? ORDER BY issued_at DESC, seq DESC LIMIT ?",
+                (session_id, limit),
+            ).fetchall()
+        committed = [json.loads(row[0]) for row in rows]
+        seen = {bill["bill_id"] for bill in committed}
+        pending = [bill for bill in pending if bill["bill_id"] not in seen]
+        bills = sorted(pending, key=lambda bill: str(bill.get("issued_at", "")), reverse=True) + committed
+        return bills[:limit]
+
+    def between(self, start: str, end: str) -> Iterator[Dict[str, object]]:
+        # Bills issued on YYYY-MM-DD dates start..end inclusive, oldest first.
+        # Keyset-paged with one short query per page, so a streaming caller can
+        # resume on another thread and never holds a read transaction open. The
+        # first page is read here, so an unreadable ledger fails the call itself.
+        upper = _next_day(end)
+        first = self._page(start, 0, upper)
+        return self._pages(first, upper)
+
+    def _page(self, issued_at: str, seq: int, upper: str) -> List[Tuple[str, int, str]]:
+        with self._reading() as connection:
+            return connection.execute(
+                "SELECT issued_at, seq, bill FROM bills "
+                "WHERE (issued_at, seq) > (?, ?) AND issued_at < ? ORDER BY issued_at, seq LIMIT ?",
+                (issued_at, seq, upper, LEDGER_PAGE_SIZE),
+            ).fetchall()
+
+    def _pages(self, rows: List[Tuple[str, int, str]], upper: str) -> Iterator[Dict[str, object]]:
+        while True:
+            for _, _, bill in rows:
+                yield json.loads(bill)
+            if len(rows) < LEDGER_PAGE_SIZE:
+                return
+            rows = self._page(rows[-1][0], rows[-1][1], upper)
+
+    def stats(self) -> Dict[str, object]:
+        # MAX(seq) is an index lookup; COUNT(*) would scan millions of rows.
+        try:
+            with self._reading() as connection:
+                rows = connection.execute("SELECT MAX(seq) FROM bills").fetchone()[0] or 0
+        except LedgerUnavailableError:
+            rows = None
+        with self._lock:
+            return {
+                "path": self.path,
+                "rows": rows,
+                "appended": self.appended,
+                "committed": self.committed,
+                "queued": len(self._unflushed),
+                "batches": self.batches,
+                "avg_batch": round(self.committed / self.batches, 2) if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "avg_commit_ms": round(self.commit_seconds / self.batches * 1000, 3) if self.batches else 0.0,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "conflicts": self.conflicts,
+                "last_conflict": self.last_conflict,
+                "overflows": self.overflows,
+                "writer_alive": self._writer is not None and self._writer.is_alive(),
+            }
@@ -1,12 +1,62 @@
 import os
 from pathlib import Path
+from tempfile import gettempdir
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "").strip()
 MODEL_NAME = os.getenv("MODEL_NAME", "gemini-2.5-flash")
+# Models visible to the API key, cached between boots so warm-up skips models.list(); empty path disables.
+MODEL_LIST_CACHE_PATH = os.getenv(
+    "MODEL_LIST_CACHE_PATH",
+    str(Path(gettempdir()) / "cloudnest_models.json"),
+).strip()
+MODEL_LIST_CACHE_TTL_SECONDS = float(os.getenv("MODEL_LIST_CACHE_TTL_SECONDS", "86400"))
+# Concurrent Gemini calls per process; extra requests wait this long for a slot, then get a retrieval-only answer.
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "64"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+# Model answers reused for the same question, retrieved context and model; size 0 disables.
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+# Paraphrase reuse over hashed n-gram vectors of the question (needs numpy); off by default, set a size (e.g. 512)
+# to enable. Hashed n-grams catch rewordings and misspellings ("is the biriyani spicy?"), not synonyms: at 0.8,
+# scripts/bench_semantic_cache.py reuses 3 of 9 paraphrases with no false hits, and "open on sunday" / "open on
+# monday" (about 0.65) stay apart. Negation barely moves the vectors ("is it spicy" / "is it not spicy" score about
+# 0.9), so questions with a different number of negations never match. /metrics lists recent hit similarities.
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "0"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8"))
 DATA_PATH = os.getenv("DATA_PATH", str(BASE_DIR / "data" / "restaurant.txt"))
+# Compiled knowledge-base snapshot (python -m app.kb_snapshot); set empty to always build in memory. Loading it
+# skips the rebuild and memory-maps the dense vectors; the rest of the index is still unpickled into memory.
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR", str(BASE_DIR / "data" / "index_snapshot")).strip()
 TOP_K_CONTEXT_LINES = int(os.getenv("TOP_K_CONTEXT_LINES", "12"))
+# keyword: query-term hits plus exact-phrase bonus | bm25: BM25 over knowledge-base lines
+# dense: local hashed n-gram vectors (needs numpy) | hybrid: bm25 and dense fused by rank
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "keyword").strip().lower()
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# chunk: rank whole sections and menu items | line: rank individual knowledge-base lines
+RETRIEVAL_UNIT = os.getenv("RETRIEVAL_UNIT", "chunk").strip().lower()
+DENSE_DIMENSIONS = int(os.getenv("DENSE_DIMENSIONS", "512"))
+# Cosine similarity below this is treated as no match; hashed n-grams of unrelated text sit around 0.05-0.12.
+DENSE_MIN_SIMILARITY = float(os.getenv("DENSE_MIN_SIMILARITY", "0.15"))
+# Conversation state per session_id: dropped after this long without a message, oldest evicted past the cap.
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "86400"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "100000"))
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60"))
+# Per-session turn locks are striped over this many mutexes; unrelated sessions rarely share one.
+SESSION_LOCK_STRIPES = int(os.getenv("SESSION_LOCK_STRIPES", "1024"))
+# Responses kept per session for idempotency-key replays; retried requests return them without a new turn.
+# Not kept with SESSION_BACKEND=token: a retry carries the token from before the reply existed.
+IDEMPOTENCY_REPLIES_PER_SESSION = int(os.getenv("IDEMPOTENCY_REPLIES_PER_SESSION", "16"))
+# memory: per process | sqlite: shared by workers on one host (WAL) | redis: shared across instances
+# token: no server-side state; each response carries an HMAC-signed state_token the client sends back
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").strip().lower()
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", str(BASE_DIR / "data" / "sessions.sqlite3")).strip()
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0").strip()
+SESSION_REDIS_PREFIX = os.getenv("SESSION_REDIS_PREFIX", "cloudnest:session:")
+SESSION_TOKEN_SECRET = os.getenv("SESSION_TOKEN_SECRET", "").strip()
+SESSION_TOKEN_COMPRESS = os.getenv("SESSION_TOKEN_COMPRESS", "true").strip().lower() in {"1", "true", "yes"}
 
 # Invoice branding configuration
 RESTAURANT_NAME = os.getenv("RESTAURANT_NAME", "CloudNest Restaurant")
@@ -24,3 +74,29 @@ INVOICE_LOGO_PATH = os.getenv(
 ).strip()
 INVOICE_LOGO_WIDTH = float(os.getenv("INVOICE_LOGO_WIDTH", "42"))
 INVOICE_LOGO_HEIGHT = float(os.getenv("INVOICE_LOGO_HEIGHT", "42"))
+# Rendered invoice PDFs are kept in memory up to this many bytes (least recently downloaded evicted first).
+INVOICE_CACHE_MAX_BYTES = int(os.getenv("INVOICE_CACHE_MAX_BYTES", "33554432"))
+# Worker processes that render each invoice as soon as its bill is confirmed; 0 (default) renders on download only.
+# Each is a separate Python process with reportlab loaded (about 25 MiB resident), per uvicorn worker.
+INVOICE_RENDER_WORKERS = int(os.getenv("INVOICE_RENDER_WORKERS", "0"))
+# Bills waiting for a render worker beyond this are rendered on download instead.
+INVOICE_RENDER_QUEUE = int(os.getenv("INVOICE_RENDER_QUEUE", "64"))
+# Worker processes for /bills/export; a merged PDF is capped since it is built in memory (ZIP streams).
+INVOICE_EXPORT_WORKERS = int(os.getenv("INVOICE_EXPORT_WORKERS", "2"))
+INVOICE_EXPORT_PDF_MAX_BILLS = int(os.getenv("INVOICE_EXPORT_PDF_MAX_BILLS", "2000"))
+# Append-only SQLite ledger of every confirmed bill, off by default; point it at a persistent volume the app user
+# can write to. The file is created on the first bill and commits are batched off the request path.
+BILL_LEDGER_PATH = os.getenv("BILL_LEDGER_PATH", "").strip()
+BILL_LEDGER_BATCH_SIZE = int(os.getenv("BILL_LEDGER_BATCH_SIZE", "256"))
+# How long /bills/export waits for queued bills to be committed before answering 503.
+BILL_LEDGER_FLUSH_TIMEOUT_SECONDS = float(os.getenv("BILL_LEDGER_FLUSH_TIMEOUT_SECONDS", "10"))
+# Sequential GST invoice numbers (CN-2627-000001), off by default (random bill ids). Only set this to a SQLite
+# file on storage shared by every worker and instance and kept across redeploys: a per-container file restarts
+# at 000001 and reissues numbers. Each worker reserves a block of numbers at a time and hands unused ones back on
+# a clean shutdown; a killed worker leaves up to 1.5 blocks unissued, logged in the file's invoice_blocks table.
+INVOICE_NUMBER_PATH = os.getenv("INVOICE_NUMBER_PATH", "").strip()
+# 1 gives strictly ordered numbers, but then every checkout takes the file lock and moves to a worker thread.
+INVOICE_NUMBER_BLOCK_SIZE = int(os.getenv("INVOICE_NUMBER_BLOCK_SIZE", "20"))
+INVOICE_NUMBER_PREFIX = os.getenv("INVOICE_NUMBER_PREFIX", "CN").strip()
+# Bearer token for back-office endpoints such as /bills/export; they are disabled while it is empty.
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "").strip()
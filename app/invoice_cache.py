@@ -0,0 +1,70 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+
+def invoice_etag(bill: Dict[str, object], branding: Hashable) -> str:
+    # Derived from what is drawn, not from the PDF bytes (reportlab stamps each
+    # render with a creation date), so every worker agrees on it without rendering.
+    payload = json.dumps([bill, branding], sort_keys=True, separators=(",", ":"), default=str)
+    return '"' + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+# Rendered invoice PDFs keyed by their ETag, so a bill drawn with other branding
+# is a different entry. Bounded by total bytes rather than entry count: invoices
+# with long item lists or a large logo are several times the size of short ones.
+class InvoiceCache:
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, etag: str) -> bytes | None:
+        with self._lock:
+            pdf = self._entries.get(etag)
+            if pdf is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(etag)
+            self.hits += 1
+            return pdf
+
+    def put(self, etag: str, pdf: bytes) -> None:
+        if len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(etag, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self._entries[etag] = pdf
+            self.bytes += len(pdf)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,120 @@
+import multiprocessing
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Tuple
+
+EXPORT_BATCH_SIZE = 32
+ISSUED_AT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+# Collects what zipfile writes so it can be handed out chunk by chunk. It has
+# no tell()/seek(), so zipfile streams entries with data descriptors instead of
+# seeking back to patch headers.
+class _ChunkSink:
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _zip_entry(bill: Dict[str, object]) -> zipfile.ZipInfo:
+    try:
+        issued_at = datetime.strptime(str(bill.get("issued_at", "")), ISSUED_AT_FORMAT)
+    except ValueError:
+        issued_at = datetime.now()
+    # PDFs are already Flate-compressed inside; deflating them again costs CPU for almost nothing.
+    entry = zipfile.ZipInfo(f"{bill['bill_id']}.pdf", date_time=issued_at.timetuple()[:6])
+    entry.compress_type = zipfile.ZIP_STORED
+    return entry
+
+
+# Renders bills for bulk export on a process pool of its own, separate from the
+# pre-render pool so an end-of-day export never delays checkout downloads.
+# Bills are sent in batches and at most two batches per worker are in flight,
+# so memory stays flat however many bills the export covers.
+class InvoiceExporter:
+    def __init__(
+        self,
+        workers: int,
+        render_batch: Callable[[List[Dict[str, object]]], List[bytes]],
+        render_merged: Callable[[List[Dict[str, object]]], bytes],
+        batch_size: int = EXPORT_BATCH_SIZE,
+    ) -> None:
+        self.workers = max(1, workers)
+        self.render_batch = render_batch
+        self.render_merged = render_merged
+        self.batch_size = batch_size
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self.exports = 0
+        self.invoices = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def zip_stream(self, bills: Iterable[Dict[str, object]]) -> Iterator[bytes]:
+        pool = self._pool()
+        bill_iter = iter(bills)
+        in_flight: Deque[Tuple[List[Dict[str, object]], Future]] = deque()
+        sink = _ChunkSink()
+        archive = zipfile.ZipFile(sink, "w")
+        try:
+            while True:
+                while len(in_flight) < 2 * self.workers:
+                    batch = list(islice(bill_iter, self.batch_size))
+                    if not batch:
+                        break
+                    in_flight.append((batch, pool.submit(self.render_batch, batch)))
+                if not in_flight:
+                    break
+                # Entries keep the order bills arrived in; later batches render meanwhile.
+                batch, future = in_flight.popleft()
+                for bill, pdf in zip(batch, future.result()):
+                    archive.writestr(_zip_entry(bill), pdf)
+                    yield sink.drain()
+                with self._lock:
+                    self.invoices += len(batch)
+            archive.close()
+            with self._lock:
+                self.exports += 1
+            yield sink.drain()
+        finally:
+            # Reached early when the client disconnects: drop renders nobody will read.
+            for _, future in in_flight:
+                future.cancel()
+
+    def merged_pdf(self, bills: List[Dict[str, object]]) -> bytes:
+        # A single document cannot be assembled from parts rendered elsewhere
+        # without a PDF merging library, so it is drawn by one worker.
+        pdf = self._pool().submit(self.render_merged, bills).result()
+        with self._lock:
+            self.exports += 1
+            self.invoices += len(bills)
+        return pdf
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {"workers": self.workers, "exports": self.exports, "invoices": self.invoices}
@@ -0,0 +1,242 @@
+import atexit
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Set, Tuple
+
+
+# GST invoice numbers run in one series per financial year (April to March),
+# e.g. "2627" for April 2026 to March 2027.
+def financial_year(day: datetime) -> str:
+    start = day.year if day.month >= 4 else day.year - 1
+    return f"{start % 100:02d}{(start + 1) % 100:02d}"
+
+
+# Sequential invoice numbers shared by every worker using the same SQLite file.
+# A worker reserves a block of block_size numbers in one short BEGIN IMMEDIATE
+# transaction and then hands them out from memory, so only one bill in
+# block_size touches the cross-process lock. Once half a block is used, the
+# next block is reserved on a background thread, so allocate() normally never
+# waits on the file; ready() tells async callers whether it would. Numbers are
+# unique and increase within each worker; across workers they follow block
+# order rather than strict issue time. Unused numbers go back to the series on
+# a clean exit when no later block was taken; a crash leaves a gap of at most
+# one and a half blocks per worker. block_size=1 gives strictly ordered numbers
+# at one lock per bill, with no reserving ahead: ready() is then always False,
+# so every async checkout takes the lock on a worker thread.
+#
+# Every reserved block is logged in invoice_blocks with the process that took
+# it and, after a clean exit, the number its unused tail was handed back from.
+# A number inside a logged block that is neither returned nor in the bill
+# ledger was abandoned by a crashed or killed worker, so every gap in the
+# series can be accounted for.
+class InvoiceNumberAllocator:
+    def __init__(self, path: str, block_size: int = 20, prefix: str = "CN") -> None:
+        self.path = path
+        self.block_size = max(1, block_size)
+        self.prefix = prefix
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._refilled = threading.Condition(self._lock)
+        self._local = threading.local()
+        # series -> (next number to hand out, end of the reserved block, exclusive)
+        self._blocks: Dict[str, Tuple[int, int]] = {}
+        # series -> the block reserved ahead, used once the current one runs out
+        self._spare: Dict[str, Tuple[int, int]] = {}
+        self._refilling: Set[str] = set()
+        self.issued = 0
+        self.blocks_reserved = 0
+        self.returned = 0
+        self.reserve_seconds = 0.0
+        self.max_reserve_seconds = 0.0
+        self.errors = 0
+        self.last_error = ""
+        # Opened on the first bill, not here: rag_engine is also imported at image
+        # build time, as a different user.
+        atexit.register(self.release)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=FULL")
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS invoice_series (series TEXT PRIMARY KEY, next_number INTEGER NOT NULL);
+                CREATE TABLE IF NOT EXISTS invoice_blocks (
+                    series TEXT NOT NULL,
+                    first_number INTEGER NOT NULL,
+                    end_number INTEGER NOT NULL,
+                    holder TEXT NOT NULL,
+                    reserved_at REAL NOT NULL,
+                    returned_from INTEGER,
+                    PRIMARY KEY (series, first_number)
+                );
+                """
+            )
+            self._local.connection = connection
+        return connection
+
+    def _reserve(self, series: str) -> Tuple[int, int]:
+        started = time.perf_counter()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT next_number FROM invoice_series WHERE series = ?", (series,)).fetchone()
+            first = row[0] if row is not None else 1
+            connection.execute(
+                "INSERT INTO invoice_series (series, next_number) VALUES (?, ?) "
+                "ON CONFLICT (series) DO UPDATE SET next_number = excluded.next_number",
+                (series, first + self.block_size),
+            )
+            # A block handed back and reserved again starts at the same number.
+            connection.execute(
+                "INSERT OR REPLACE INTO invoice_blocks (series, first_number, end_number, holder, reserved_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (series, first, first + self.block_size, self.holder, time.time()),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        self._local.elapsed = time.perf_counter() - started
+        return first, first + self.block_size
+
+    def _count_reserve(self) -> None:
+        elapsed = getattr(self._local, "elapsed", 0.0)
+        self.blocks_reserved += 1
+        self.reserve_seconds += elapsed
+        self.max_reserve_seconds = max(self.max_reserve_seconds, elapsed)
+
+    def _give_back(self, series: str, block: Tuple[int, int]) -> None:
+        # Only possible while this block is still the newest one in the series.
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            returned = connection.execute(
+                "UPDATE invoice_series SET next_number = ? WHERE series = ? AND next_number = ?",
+                (block[0], series, block[1]),
+            ).rowcount
+            if returned:
+                connection.execute(
+                    "UPDATE invoice_blocks SET returned_from = ? WHERE series = ? AND end_number = ? AND holder = ?",
+                    (block[0], series, block[1], self.holder),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        if returned:
+            self.returned += block[1] - block[0]
+
+    def _give_back_series(self, series: str) -> None:
+        # The spare block is newer than the current one, so it goes back first.
+        for block in (self._spare.pop(series, None), self._blocks.pop(series, None)):
+            if block is not None and block[0] < block[1]:
+                try:
+                    self._give_back(series, block)
+                except sqlite3.Error as exc:
+                    self.errors += 1
+                    self.last_error = str(exc)
+
+    def _refill_later(self, series: str) -> None:
+        # Called with the lock held.
+        if self.block_size == 1 or series in self._spare or series in self._refilling:
+            return
+        self._refilling.add(series)
+        threading.Thread(target=self._refill, args=(series,), name="invoice-numbers", daemon=True).start()
+
+    def _refill(self, series: str) -> None:
+        try:
+            block = self._reserve(series)
+        except Exception as exc:
+            # allocate() reserves for itself when no spare block arrives.
+            block = None
+            with self._lock:
+                self.errors += 1
+                self.last_error = str(exc)
+        finally:
+            connection = getattr(self._local, "connection", None)
+            if connection is not None:
+                connection.close()
+        with self._lock:
+            if block is not None:
+                self._spare[series] = block
+                self._count_reserve()
+            self._refilling.discard(series)
+            self._refilled.notify_all()
+
+    def ready(self, issued_at: datetime | None = None) -> bool:
+        # True when allocate() would be served from memory. Lock-free so the event
+        # loop never waits behind a thread that is reserving; when nothing is
+        # ready it starts reserving in the background for the next caller.
+        if self.block_size == 1:
+            # Nothing is ever reserved ahead: each number is taken under the file lock.
+            return False
+        series = financial_year(issued_at or datetime.now())
+        block = self._blocks.get(series)
+        if (block is not None and block[0] < block[1]) or series in self._spare:
+            return True
+        if self._lock.acquire(blocking=False):
+            try:
+                self._refill_later(series)
+            finally:
+                self._lock.release()
+        return False
+
+    def allocate(self, issued_at: datetime | None = None) -> str:
+        series = financial_year(issued_at or datetime.now())
+        with self._lock:
+            block = self._blocks.get(series)
+            if block is None or block[0] >= block[1]:
+                # A new financial year starts a new series; return the old year's leftovers.
+                for old_series in set(self._blocks) | set(self._spare):
+                    if old_series != series:
+                        self._give_back_series(old_series)
+                # A block reserved on the side would be older than one reserved
+                # now, so wait for it rather than race it.
+                while series in self._refilling:
+                    self._refilled.wait()
+                block = self._spare.pop(series, None)
+                if block is None:
+                    block = self._reserve(series)
+                    self._count_reserve()
+            number, end = block
+            self._blocks[series] = (number + 1, end)
+            self.issued += 1
+            if end - number - 1 <= self.block_size // 2:
+                self._refill_later(series)
+        return f"{self.prefix}-{series}-{number:06d}"
+
+    def release(self, timeout: float = 10) -> None:
+        with self._lock:
+            self._refilled.wait_for(lambda: not self._refilling, timeout)
+            for series in set(self._blocks) | set(self._spare):
+                self._give_back_series(series)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "path": self.path,
+                "block_size": self.block_size,
+                "issued": self.issued,
+                "blocks_reserved": self.blocks_reserved,
+                "returned": self.returned,
+                "reserve_ms_avg": (
+                    round(self.reserve_seconds / self.blocks_reserved * 1000, 3) if self.blocks_reserved else 0.0
+                ),
+                "reserve_ms_max": round(self.max_reserve_seconds * 1000, 3),
+                "current": {series: {"next": block[0], "end": block[1]} for series, block in self._blocks.items()},
+                "spare": {series: {"next": block[0], "end": block[1]} for series, block in self._spare.items()},
+                "refilling": sorted(self._refilling),
+                "errors": self.errors,
+                "last_error": self.last_error,
+            }
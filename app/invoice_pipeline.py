@@ -0,0 +1,127 @@
+import multiprocessing
+import threading
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor
+from typing import Callable, Dict
+
+from app.invoice_cache import InvoiceCache
+
+
+# Renders confirmed bills ahead of their download, so /bill/pdf usually finds
+# the bytes in the cache or only waits for the rest of a render already under
+# way. reportlab layout is pure Python and holds the GIL, so renders run in
+# worker processes rather than on the server's threads. At most max_pending
+# renders are queued; bills past that are rendered on demand when downloaded.
+class InvoiceRenderPipeline:
+    def __init__(
+        self,
+        cache: InvoiceCache,
+        render: Callable[[Dict[str, object]], bytes],
+        workers: int,
+        max_pending: int,
+        warm: Callable[[], None] | None = None,
+    ) -> None:
+        self.cache = cache
+        self.render = render
+        self.workers = workers
+        self.max_pending = max_pending
+        self._warm = warm
+        self._lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending: Dict[str, Future] = {}
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.joined = 0
+        self.rendered_inline = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def start(self) -> None:
+        with self._lock:
+            if not self.enabled or self._executor is not None:
+                return
+            # spawn, not fork: the server process already runs sweeper and warm-up threads.
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            executor = self._executor
+        if self._warm is not None:
+            # Starts every worker and imports reportlab there before the first bill arrives.
+            for _ in range(self.workers):
+                executor.submit(self._warm)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, etag: str, bill: Dict[str, object]) -> None:
+        if not self.enabled:
+            return
+        self.start()
+        with self._lock:
+            if etag in self._pending or self._executor is None:
+                return
+            if len(self._pending) >= self.max_pending:
+                self.skipped += 1
+                return
+            try:
+                future = self._executor.submit(self.render, bill)
+            except BrokenExecutor:
+                # A crashed worker breaks the whole pool; the next bill starts a fresh one.
+                self._executor.shutdown(wait=False)
+                self._executor = None
+                self.failed += 1
+                return
+            self._pending[etag] = future
+            self.submitted += 1
+        future.add_done_callback(lambda done: self._finish(etag, done))
+
+    def _finish(self, etag: str, future: Future) -> None:
+        ok = not future.cancelled() and future.exception() is None
+        # Cached before leaving _pending, so a download never sees neither.
+        if ok:
+            self.cache.put(etag, future.result())
+        with self._lock:
+            self._pending.pop(etag, None)
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def get(self, etag: str, bill: Dict[str, object]) -> bytes:
+        pdf = self.cache.get(etag)
+        if pdf is not None:
+            return pdf
+
+        with self._lock:
+            future = self._pending.get(etag)
+            if future is not None:
+                self.joined += 1
+        if future is not None:
+            try:
+                return future.result()
+            except Exception:
+                # A failed background render is retried here, where errors reach the caller.
+                pass
+
+        pdf = self.render(bill)
+        self.cache.put(etag, pdf)
+        with self._lock:
+            self.rendered_inline += 1
+        return pdf
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": len(self._pending),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "joined_in_flight": self.joined,
+                "rendered_inline": self.rendered_inline,
+            }
@@ -0,0 +1,266 @@
+import threading
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from app.config import (
+    INVOICE_LOGO_HEIGHT,
+    INVOICE_LOGO_PATH,
+    INVOICE_LOGO_WIDTH,
+    RESTAURANT_ADDRESS,
+    RESTAURANT_EMAIL,
+    RESTAURANT_GSTIN,
+    RESTAURANT_NAME,
+    RESTAURANT_PHONE,
+    RESTAURANT_WEBSITE,
+)
+
+# Kept free of FastAPI and the RAG engine: render workers import only this
+# module, config and reportlab.
+
+# The logo is drawn a few dozen points wide; 4 pixels per point (288 dpi) is
+# sharper than any receipt or office printer, and a large source image would
+# otherwise be compressed and encoded into every single invoice.
+LOGO_PIXELS_PER_POINT = 4
+
+_template: "InvoiceTemplate | None" = None
+_template_lock = threading.Lock()
+
+
+def invoice_branding() -> Tuple[object, ...]:
+    # Everything besides the bill that changes the rendered PDF; the logo file's
+    # stat is included so replacing the image invalidates cached invoices.
+    logo = Path(INVOICE_LOGO_PATH) if INVOICE_LOGO_PATH else None
+    try:
+        logo_stat = logo.stat() if logo is not None else None
+        logo_version = (logo_stat.st_mtime_ns, logo_stat.st_size) if logo_stat is not None else None
+    except OSError:
+        logo_version = None
+    return (
+        RESTAURANT_NAME,
+        RESTAURANT_ADDRESS,
+        RESTAURANT_PHONE,
+        RESTAURANT_GSTIN,
+        RESTAURANT_EMAIL,
+        RESTAURANT_WEBSITE,
+        INVOICE_LOGO_PATH,
+        INVOICE_LOGO_WIDTH,
+        INVOICE_LOGO_HEIGHT,
+        logo_version,
+    )
+
+
+def _load_logo(path: str, width: float, height: float) -> object | None:
+    if not path or not Path(path).exists():
+        return None
+    try:
+        from PIL import Image
+        from reportlab.lib.utils import ImageReader
+
+        with Image.open(path) as source:
+            image = source.copy()
+        image.thumbnail((max(1, int(width * LOGO_PIXELS_PER_POINT)), max(1, int(height * LOGO_PIXELS_PER_POINT))))
+        logo = ImageReader(image)
+        # Decodes now, once per template, instead of inside every render.
+        logo.getRGBData()
+        return logo
+    except Exception:
+        return None
+
+
+# Everything about an invoice that does not depend on the bill: the decoded
+# logo, the branding lines and their fonts. Built once per process and rebuilt
+# only when invoice_branding() changes. A PDF form XObject cannot be shared
+# between documents, so the header is kept as prepared drawing data rather
+# than as a form.
+class InvoiceTemplate:
+    def __init__(self, branding: Tuple[object, ...]) -> None:
+        from reportlab import rl_config
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        # Plain Flate streams instead of Flate+ASCII85: files are ~20% smaller and,
+        # without reportlab's optional C accelerator, ASCII85-encoding the logo's
+        # pixels in pure Python is most of the render time.
+        rl_config.useA85 = 0
+        self.branding = branding
+        self._canvas = canvas.Canvas
+        self.page_size = A4
+        self.logo = _load_logo(INVOICE_LOGO_PATH, INVOICE_LOGO_WIDTH, INVOICE_LOGO_HEIGHT)
+        self.title_x = 50 + int(INVOICE_LOGO_WIDTH) + 10
+        # (font, size, text, space below)
+        self.header_lines: List[Tuple[str, int, str, int]] = [
+            ("Helvetica-Bold", 16, RESTAURANT_NAME, 16),
+            ("Helvetica", 10, RESTAURANT_ADDRESS, 14),
+            ("Helvetica", 10, f"Phone: {RESTAURANT_PHONE} | GSTIN: {RESTAURANT_GSTIN}", 14),
+            ("Helvetica", 10, f"Email: {RESTAURANT_EMAIL} | Web: {RESTAURANT_WEBSITE}", 20),
+        ]
+
+    def _draw_header(self, c: object, y: float) -> float:
+        if self.logo is not None:
+            try:
+                c.drawImage(
+                    self.logo,
+                    50,
+                    y - INVOICE_LOGO_HEIGHT + 6,
+                    width=INVOICE_LOGO_WIDTH,
+                    height=INVOICE_LOGO_HEIGHT,
+                    preserveAspectRatio=True,
+                    mask="auto",
+                )
+            except Exception:
+                pass
+
+        font = None
+        for name, size, text, space_below in self.header_lines:
+            if (name, size) != font:
+                c.setFont(name, size)
+                font = (name, size)
+            c.drawString(self.title_x, y, text)
+            y -= space_below
+        return y
+
+    def render(self, bill: Dict[str, object]) -> bytes:
+        return self.render_many([bill])
+
+    def render_many(self, bills: Iterable[Dict[str, object]]) -> bytes:
+        # One document, each bill starting on a new page. The logo image is
+        # embedded once and referenced by every page.
+        buffer = BytesIO()
+        c = self._canvas(buffer, pagesize=self.page_size)
+        for bill in bills:
+            self._draw(c, bill)
+        c.save()
+        return buffer.getvalue()
+
+    def _draw(self, c: object, bill: Dict[str, object]) -> None:
+        bill_id = str(bill["bill_id"])
+        width, height = self.page_size
+        y = self._draw_header(c, height - 50)
+
+        c.setLineWidth(0.8)
+        c.line(50, y, width - 50, y)
+        y -= 18
+
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(50, y, "Tax Invoice")
+        y -= 20
+
+        c.setFont("Helvetica", 10)
+        c.drawString(50, y, f"Bill ID: {bill_id}")
+        y -= 16
+        c.drawString(50, y, f"Issued At: {bill['issued_at']}")
+        y -= 16
+
+        def ensure_space(current_y: float, min_y: float = 120) -> float:
+            if current_y >= min_y:
+                return current_y
+            c.showPage()
+            c.setFont("Helvetica", 10)
+            return height - 70
+
+        mode = str(bill.get("mode", "") or "").strip().lower()
+        if mode == "dine_in":
+            y = ensure_space(y)
+            c.drawString(50, y, "Order Type: Dine-In")
+            y -= 16
+            slot = str(bill.get("slot", "") or "").strip()
+            if slot:
+                y = ensure_space(y)
+                c.drawString(50, y, f"Dine-In Slot: {slot}")
+                y -= 16
+        elif mode == "delivery":
+            y = ensure_space(y)
+            c.drawString(50, y, "Order Type: Online Delivery")
+            y -= 16
+            address_lines = bill.get("address_lines")
+            if not isinstance(address_lines, list):
+                address = str(bill.get("address", "") or "").strip()
+                if address:
+                    address_lines = [part.strip() for part in address.split(",") if part.strip()] or [address]
+                else:
+                    address_lines = []
+
+            if address_lines:
+                y = ensure_space(y)
+                c.drawString(50, y, "Delivery Address:")
+                y -= 16
+                for line in address_lines:
+                    y = ensure_space(y)
+                    c.drawString(64, y, f"- {line}")
+                    y -= 14
+
+        y -= 24
+
+        c.setFont("Helvetica-Bold", 11)
+        c.drawString(50, y, "Item")
+        c.drawString(290, y, "Qty")
+        c.drawString(350, y, "Unit Price")
+        c.drawString(460, y, "Total")
+        y -= 14
+
+        c.setFont("Helvetica", 10)
+        for item in bill["items"]:
+            if y < 120:
+                c.showPage()
+                y = height - 70
+                c.setFont("Helvetica-Bold", 11)
+                c.drawString(50, y, "Item")
+                c.drawString(290, y, "Qty")
+                c.drawString(350, y, "Unit Price")
+                c.drawString(460, y, "Total")
+                y -= 14
+                c.setFont("Helvetica", 10)
+            c.drawString(50, y, str(item["name"]))
+            c.drawString(290, y, str(item["quantity"]))
+            c.drawString(350, y, f"Rs {item['unit_price']}")
+            c.drawString(460, y, f"Rs {item['line_total']}")
+            y -= 14
+
+        y -= 12
+        c.setFont("Helvetica-Bold", 11)
+        c.drawString(350, y, f"Subtotal: Rs {bill['subtotal']}")
+        y -= 16
+        c.drawString(350, y, f"GST (5%): Rs {bill['gst']}")
+        y -= 16
+        c.drawString(350, y, f"Total: Rs {bill['total']}")
+        y -= 28
+
+        c.setFont("Helvetica-Oblique", 9)
+        c.drawString(50, y, "Thank you for ordering with us.")
+        y -= 12
+        c.drawString(50, y, "This is a system-generated invoice.")
+
+        c.showPage()
+
+
+def invoice_template() -> InvoiceTemplate:
+    global _template
+    branding = invoice_branding()
+    template = _template
+    if template is not None and template.branding == branding:
+        return template
+    with _template_lock:
+        if _template is None or _template.branding != branding:
+            _template = InvoiceTemplate(branding)
+        return _template
+
+
+def warm_renderer() -> None:
+    # Run once in each render worker so the first invoice pays for neither the
+    # reportlab imports nor the logo decode.
+    invoice_template()
+
+
+def render_invoice_pdf(bill: Dict[str, object]) -> bytes:
+    return invoice_template().render(bill)
+
+
+def render_invoice_batch(bills: List[Dict[str, object]]) -> List[bytes]:
+    # One task per batch keeps process-pool overhead small next to a ~3 ms render.
+    template = invoice_template()
+    return [template.render(bill) for bill in bills]
+
+
+def render_merged_invoices(bills: List[Dict[str, object]]) -> bytes:
+    return invoice_template().render_many(bills)
@@ -0,0 +1,122 @@
+import argparse
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+from pathlib import Path
+from typing import Dict, Iterable
+
+from app.vector_index import HashingVectorizer, VectorIndex, dense_available
+
+try:
+    import numpy as np
+except ImportError:  # Only needed when the snapshot carries a vector matrix.
+    np = None
+
+# Bump when the pickled structures change shape so old snapshots are rebuilt.
+SNAPSHOT_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+
+logger = logging.getLogger(__name__)
+
+
+def source_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def code_digest(paths: Iterable[str]) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+# A snapshot directory holds digest-named data files plus a manifest that is
+# replaced last, so readers only ever see a complete snapshot. Only the vector
+# matrix is memory-mapped on load; the pickled state (lines, catalog, inverted
+# index) is read in full, so loading still grows with the knowledge base, just
+# several times more slowly than rebuilding it.
+def save_snapshot(directory: str, kb: object, settings: Dict[str, object]) -> None:
+    root = Path(directory)
+    root.mkdir(parents=True, exist_ok=True)
+    stem = f"kb-{str(settings['source_sha256'])[:16]}"
+
+    manifest: Dict[str, object] = {"format": SNAPSHOT_FORMAT, "settings": settings, "state": f"{stem}.pickle"}
+    vectors = getattr(kb, "vectors", None)
+    if vectors is not None:
+        vectors_name = f"{stem}-vectors.npy"
+        tmp_vectors = root / f".{vectors_name}.{os.getpid()}.tmp.npy"
+        np.save(tmp_vectors, np.ascontiguousarray(vectors.matrix, dtype=np.float32))
+        os.replace(tmp_vectors, root / vectors_name)
+        manifest["vectors"] = vectors_name
+        manifest["dimensions"] = vectors.vectorizer.dimensions
+        kb = dataclasses.replace(kb, vectors=None)
+
+    _write_atomic(root / manifest["state"], pickle.dumps(kb, protocol=pickle.HIGHEST_PROTOCOL))
+    _write_atomic(root / MANIFEST_FILE, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+
+    keep = {MANIFEST_FILE, manifest["state"], manifest.get("vectors")}
+    for path in root.glob("kb-*"):
+        if path.name not in keep:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def load_snapshot(directory: str, settings: Dict[str, object], kind: type) -> object | None:
+    # Returns None when the snapshot is missing, unreadable or built from other
+    # source text/settings/code; the caller then rebuilds from the source file.
+    root = Path(directory)
+    if not (root / MANIFEST_FILE).exists():
+        return None
+    try:
+        manifest = json.loads((root / MANIFEST_FILE).read_text(encoding="utf-8"))
+        if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("settings") != settings:
+            return None
+
+        with open(root / manifest["state"], "rb") as file:
+            kb = pickle.load(file)
+        if not isinstance(kb, kind):
+            raise TypeError(f"expected {kind.__name__}, found {type(kb).__name__}")
+
+        if manifest.get("vectors"):
+            if not dense_available():
+                return None
+            matrix = np.load(root / manifest["vectors"], mmap_mode="r")
+            vectors = VectorIndex.from_matrix(matrix, HashingVectorizer(int(manifest["dimensions"])))
+            kb = dataclasses.replace(kb, vectors=vectors)
+        return kb
+    except Exception as exc:
+        # Anything unpickling can raise (a truncated file, a class that was moved
+        # or changed shape) only means the snapshot cannot be used.
+        logger.warning("Ignoring knowledge-base snapshot in %s: %s: %s", directory, type(exc).__name__, exc)
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile the knowledge-base index snapshot for fast cold starts.")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the snapshot is current")
+    args = parser.parse_args()
+
+    from app import rag_engine
+
+    started = time.perf_counter()
+    path = rag_engine.compile_knowledge_base_snapshot(force=args.force)
+    print(f"Knowledge-base snapshot ready in {path} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
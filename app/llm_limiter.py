@@ -0,0 +1,62 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+
+class LLMBusyError(Exception):
+    pass
+
+
+# Caps in-flight model calls per process. Requests over the cap wait up to
+# queue_timeout seconds for a slot and then fail fast with LLMBusyError, so a
+# burst of chats degrades to retrieval-only answers instead of piling up.
+class LLMLimiter:
+    def __init__(self, max_in_flight: int, queue_timeout: float) -> None:
+        self.max_in_flight = max(1, max_in_flight)
+        self.queue_timeout = queue_timeout
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # asyncio primitives belong to one event loop; test clients and scripts may run several in turn.
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._loop = loop
+        return self._semaphore
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        semaphore = self._get_semaphore()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout if self.queue_timeout > 0 else None)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise LLMBusyError(f"{self.in_flight} model calls already in flight") from None
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            semaphore.release()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "peak_in_flight": self.peak_in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
@@ -1,26 +1,84 @@
+import hmac
+import json
+from contextlib import asynccontextmanager
+from datetime import date
+from itertools import islice
 from pathlib import Path
-from tempfile import gettempdir
+from typing import Dict
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 
+from app.bill_ledger import LedgerUnavailableError
 from app.config import (
-    INVOICE_LOGO_HEIGHT,
-    INVOICE_LOGO_PATH,
-    INVOICE_LOGO_WIDTH,
-    RESTAURANT_ADDRESS,
-    RESTAURANT_EMAIL,
-    RESTAURANT_GSTIN,
-    RESTAURANT_NAME,
-    RESTAURANT_PHONE,
-    RESTAURANT_WEBSITE,
+    ADMIN_API_TOKEN,
+    INVOICE_CACHE_MAX_BYTES,
+    INVOICE_EXPORT_PDF_MAX_BILLS,
+    INVOICE_EXPORT_WORKERS,
+    INVOICE_RENDER_QUEUE,
+    INVOICE_RENDER_WORKERS,
 )
-from app.rag_engine import ask_question, get_latest_bill
+from app.invoice_cache import InvoiceCache, etag_matches, invoice_etag
+from app.invoice_export import InvoiceExporter
+from app.invoice_pipeline import InvoiceRenderPipeline
+from app.invoice_renderer import (
+    invoice_branding,
+    render_invoice_batch,
+    render_invoice_pdf,
+    render_merged_invoices,
+    warm_renderer,
+)
+from app.rag_engine import (
+    ask_question_async,
+    get_bill,
+    get_engine_metrics,
+    get_latest_bill,
+    get_readiness,
+    get_session_bills,
+    iter_bills,
+    register_bill_listener,
+    release_invoice_numbers,
+    start_model_warmup,
+    start_session_sweeper,
+    stream_question,
+)
+
+invoice_cache = InvoiceCache(INVOICE_CACHE_MAX_BYTES)
+invoice_renders = InvoiceRenderPipeline(
+    invoice_cache, render_invoice_pdf, INVOICE_RENDER_WORKERS, INVOICE_RENDER_QUEUE, warm=warm_renderer
+)
+invoice_exporter = InvoiceExporter(INVOICE_EXPORT_WORKERS, render_invoice_batch, render_merged_invoices)
+
+
+def _prerender_invoice(_: str, bill: Dict[str, object]) -> None:
+    invoice_renders.submit(invoice_etag(bill, invoice_branding()), bill)
+
+
+register_bill_listener(_prerender_invoice)
+
 
-app = FastAPI(title="CloudNest Restaurant Bot")
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Model discovery runs in a background thread so startup never waits on the network.
+    start_model_warmup()
+    start_session_sweeper()
+    invoice_renders.start()
+    yield
+    invoice_renders.shutdown()
+    invoice_exporter.shutdown()
+    release_invoice_numbers()
+
+
+app = FastAPI(title="CloudNest Restaurant Bot", lifespan=lifespan)
+
+
+@app.exception_handler(LedgerUnavailableError)
+async def ledger_unavailable(_: Request, exc: LedgerUnavailableError):
+    # The ledger file is locked, unreadable or still catching up; bills are kept and the call can be retried.
+    return JSONResponse(status_code=503, content={"error": str(exc)}, headers={"Retry-After": "5"})
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 INDEX_FILE = BASE_DIR / "index.html"
@@ -41,6 +99,10 @@ app.mount("/menu-images", StaticFiles(directory=str(MENU_IMAGES_DIR)), name="men
 class QuestionRequest(BaseModel):
     question: str = Field(min_length=1)
     session_id: str = Field(default="default")
+    # Only used with SESSION_BACKEND=token: the state_token from the previous response.
+    state_token: str | None = Field(default=None, max_length=8192)
+    # Client-generated per message and resent unchanged on retries; a retry returns the original response.
+    idempotency_key: str | None = Field(default=None, max_length=128)
 
 
 @app.get("/")
@@ -54,8 +116,32 @@ def home():
 
 
 @app.post("/ask")
-def ask(request: QuestionRequest):
-    return ask_question(request.question, session_id=request.session_id)
+async def ask(request: QuestionRequest):
+    return await ask_question_async(
+        request.question,
+        session_id=request.session_id,
+        state_token=request.state_token,
+        idempotency_key=request.idempotency_key,
+    )
+
+
+@app.post("/ask/stream")
+async def ask_stream(request: QuestionRequest):
+    async def events():
+        async for event, data in stream_question(
+            request.question,
+            session_id=request.session_id,
+            state_token=request.state_token,
+            idempotency_key=request.idempotency_key,
+        ):
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keeps proxies (nginx, Cloud Run's front end) from buffering the stream.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/healthz")
@@ -63,155 +149,123 @@ def healthz():
     return {"status": "ok"}
 
 
+@app.get("/readyz")
+def readyz():
+    readiness = get_readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+
+@app.get("/metrics")
+def metrics():
+    return {
+        **get_engine_metrics(),
+        "invoice_cache": invoice_cache.stats(),
+        "invoice_renders": invoice_renders.stats(),
+        "invoice_exports": invoice_exporter.stats(),
+    }
+
+
+def _is_admin(request: Request) -> bool:
+    supplied = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    return bool(ADMIN_API_TOKEN) and hmac.compare_digest(supplied.encode("utf-8"), ADMIN_API_TOKEN.encode("utf-8"))
+
+
+def _admin_error(request: Request) -> JSONResponse | None:
+    if not ADMIN_API_TOKEN:
+        return JSONResponse(status_code=403, content={"error": "Set ADMIN_API_TOKEN to enable this endpoint."})
+    if not _is_admin(request):
+        return JSONResponse(status_code=401, content={"error": "Missing or invalid admin token."})
+    return None
+
+
+def _past_bill(request: Request, bill_id: str, session_id: str) -> Dict[str, object] | None:
+    # A past bill is visible to the session that confirmed it, or to the back office.
+    found = get_bill(bill_id)
+    if found is None:
+        return None
+    owner, bill = found
+    return bill if owner == session_id or _is_admin(request) else None
+
+
+@app.get("/bills")
+def session_bills(session_id: str, limit: int = Query(default=20, ge=1, le=200)):
+    return {"session_id": session_id, "bills": get_session_bills(session_id, limit)}
+
+
 @app.get("/bill/pdf")
-def bill_pdf(session_id: str):
-    bill = get_latest_bill(session_id)
+def bill_pdf(
+    request: Request,
+    session_id: str = "",
+    bill_id: str = "",
+    # SESSION_BACKEND=token: sent as a header so the session state never lands in URLs, logs or browser history.
+    state_token: str | None = Header(default=None, alias="X-State-Token", max_length=8192),
+):
+    if bill_id:
+        bill = _past_bill(request, bill_id, session_id)
+    else:
+        bill = get_latest_bill(session_id, state_token=state_token)
     if not bill:
         return JSONResponse(status_code=404, content={"error": "No generated bill found for this session."})
 
+    etag = invoice_etag(bill, invoice_branding())
+    # Invoices carry personal details: browsers may keep them but must revalidate, shared caches must not.
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    # Usually already rendered (or rendering) since the bill was confirmed.
     try:
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfgen import canvas
+        pdf = invoice_renders.get(etag, bill)
     except ImportError:
         return JSONResponse(
             status_code=500,
             content={"error": "Missing reportlab dependency. Run: pip install reportlab"},
         )
 
-    bill_id = str(bill["bill_id"])
-    pdf_path = Path(gettempdir()) / f"{bill_id}.pdf"
-
-    c = canvas.Canvas(str(pdf_path), pagesize=A4)
-    width, height = A4
-    y = height - 50
-
-    # Header with optional logo and business details.
-    logo_x = 50
-    if INVOICE_LOGO_PATH and Path(INVOICE_LOGO_PATH).exists():
-        try:
-            c.drawImage(
-                INVOICE_LOGO_PATH,
-                logo_x,
-                y - INVOICE_LOGO_HEIGHT + 6,
-                width=INVOICE_LOGO_WIDTH,
-                height=INVOICE_LOGO_HEIGHT,
-                preserveAspectRatio=True,
-                mask="auto",
-            )
-        except Exception:
-            pass
-
-    title_x = 50 + int(INVOICE_LOGO_WIDTH) + 10
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(title_x, y, RESTAURANT_NAME)
-    y -= 16
-
-    c.setFont("Helvetica", 10)
-    c.drawString(title_x, y, RESTAURANT_ADDRESS)
-    y -= 14
-    c.drawString(title_x, y, f"Phone: {RESTAURANT_PHONE} | GSTIN: {RESTAURANT_GSTIN}")
-    y -= 14
-    c.drawString(title_x, y, f"Email: {RESTAURANT_EMAIL} | Web: {RESTAURANT_WEBSITE}")
-    y -= 20
-
-    c.setLineWidth(0.8)
-    c.line(50, y, width - 50, y)
-    y -= 18
-
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(50, y, "Tax Invoice")
-    y -= 20
-
-    c.setFont("Helvetica", 10)
-    c.drawString(50, y, f"Bill ID: {bill_id}")
-    y -= 16
-    c.drawString(50, y, f"Issued At: {bill['issued_at']}")
-    y -= 16
-
-    def ensure_space(current_y: float, min_y: float = 120) -> float:
-        if current_y >= min_y:
-            return current_y
-        c.showPage()
-        c.setFont("Helvetica", 10)
-        return height - 70
-
-    mode = str(bill.get("mode", "") or "").strip().lower()
-    if mode == "dine_in":
-        y = ensure_space(y)
-        c.drawString(50, y, "Order Type: Dine-In")
-        y -= 16
-        slot = str(bill.get("slot", "") or "").strip()
-        if slot:
-            y = ensure_space(y)
-            c.drawString(50, y, f"Dine-In Slot: {slot}")
-            y -= 16
-    elif mode == "delivery":
-        y = ensure_space(y)
-        c.drawString(50, y, "Order Type: Online Delivery")
-        y -= 16
-        address_lines = bill.get("address_lines")
-        if not isinstance(address_lines, list):
-            address = str(bill.get("address", "") or "").strip()
-            if address:
-                address_lines = [part.strip() for part in address.split(",") if part.strip()] or [address]
-            else:
-                address_lines = []
-
-        if address_lines:
-            y = ensure_space(y)
-            c.drawString(50, y, "Delivery Address:")
-            y -= 16
-            for line in address_lines:
-                y = ensure_space(y)
-                c.drawString(64, y, f"- {line}")
-                y -= 14
-
-    y -= 24
-
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(50, y, "Item")
-    c.drawString(290, y, "Qty")
-    c.drawString(350, y, "Unit Price")
-    c.drawString(460, y, "Total")
-    y -= 14
-
-    c.setFont("Helvetica", 10)
-    for item in bill["items"]:
-        if y < 120:
-            c.showPage()
-            y = height - 70
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(50, y, "Item")
-            c.drawString(290, y, "Qty")
-            c.drawString(350, y, "Unit Price")
-            c.drawString(460, y, "Total")
-            y -= 14
-            c.setFont("Helvetica", 10)
-        c.drawString(50, y, str(item["name"]))
-        c.drawString(290, y, str(item["quantity"]))
-        c.drawString(350, y, f"Rs {item['unit_price']}")
-        c.drawString(460, y, f"Rs {item['line_total']}")
-        y -= 14
-
-    y -= 12
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(350, y, f"Subtotal: Rs {bill['subtotal']}")
-    y -= 16
-    c.drawString(350, y, f"GST (5%): Rs {bill['gst']}")
-    y -= 16
-    c.drawString(350, y, f"Total: Rs {bill['total']}")
-    y -= 28
-
-    c.setFont("Helvetica-Oblique", 9)
-    c.drawString(50, y, "Thank you for ordering with us.")
-    y -= 12
-    c.drawString(50, y, "This is a system-generated invoice.")
-
-    c.showPage()
-    c.save()
-
-    return FileResponse(
-        path=pdf_path,
-        media_type="application/pdf",
-        filename=f"{bill_id}.pdf",
-    )
+    headers["Content-Disposition"] = f'attachment; filename="{bill["bill_id"]}.pdf"'
+    return Response(content=pdf, media_type="application/pdf", headers=headers)
+
+
+@app.get("/bills/export")
+def export_bills(
+    request: Request,
+    start: date,
+    end: date,
+    output: str = Query(default="zip", alias="format", pattern="^(zip|pdf)$"),
+):
+    denied = _admin_error(request)
+    if denied is not None:
+        return denied
+    if end < start:
+        return JSONResponse(status_code=400, content={"error": "end must not be before start."})
+    try:
+        bills = iter_bills(start.isoformat(), end.isoformat())
+    except LedgerUnavailableError:
+        raise
+    except RuntimeError as exc:
+        return JSONResponse(status_code=409, content={"error": str(exc)})
+
+    filename = f"invoices-{start.isoformat()}-{end.isoformat()}"
+    headers = {"Cache-Control": "no-store"}
+    if output == "zip":
+        headers["Content-Disposition"] = f'attachment; filename="{filename}.zip"'
+        return StreamingResponse(invoice_exporter.zip_stream(bills), media_type="application/zip", headers=headers)
+
+    selected = list(islice(bills, INVOICE_EXPORT_PDF_MAX_BILLS + 1))
+    if len(selected) > INVOICE_EXPORT_PDF_MAX_BILLS:
+        return JSONResponse(
+            status_code=413,
+            content={"error": f"More than {INVOICE_EXPORT_PDF_MAX_BILLS} bills; use format=zip for this range."},
+        )
+    if not selected:
+        return JSONResponse(status_code=404, content={"error": "No bills in this date range."})
+    headers["Content-Disposition"] = f'attachment; filename="{filename}.pdf"'
+    return Response(content=invoice_exporter.merged_pdf(selected), media_type="application/pdf", headers=headers)
+
+
+@app.get("/bills/{bill_id}")
+def past_bill(request: Request, bill_id: str, session_id: str = ""):
+    bill = _past_bill(request, bill_id, session_id)
+    if bill is None:
+        return JSONResponse(status_code=404, content={"error": "No bill with this id for this session."})
+    return bill
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from google import genai
+
+PREFERRED_FALLBACK_MODELS = [
+    "gemini-2.5-flash",
+    "gemini-2.0-flash",
+    "gemini-2.0-flash-lite",
+    "gemini-flash-latest",
+]
+
+STATE_STARTING = "starting"
+STATE_READY = "ready"
+STATE_DISABLED = "disabled"
+STATE_FAILED = "failed"
+
+
+def _normalize_model_name(name: str) -> str:
+    return name.replace("models/", "")
+
+
+def _key_fingerprint(api_key: str) -> str:
+    # Different keys can see different models; the key itself never touches disk.
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _pick_model(configured: str, available: Sequence[str]) -> str:
+    candidates = [_normalize_model_name(configured)] + PREFERRED_FALLBACK_MODELS
+    if available:
+        for candidate in candidates:
+            if candidate in available:
+                return candidate
+        return available[0]
+    return _normalize_model_name(configured)
+
+
+def _list_generate_models(client: object) -> List[str]:
+    available = []
+    try:
+        for item in client.models.list():
+            methods = getattr(item, "supported_actions", None)
+            if methods is None or "generateContent" in methods:
+                available.append(_normalize_model_name(item.name))
+    except Exception:
+        available = []
+    return available
+
+
+def load_cached_models(path: str, api_key: str, ttl_seconds: float) -> List[str] | None:
+    if not path or ttl_seconds <= 0:
+        return None
+    try:
+        payload = json.loads(Path(path).read_text(encoding="utf-8"))
+        if payload.get("key") != _key_fingerprint(api_key):
+            return None
+        if time.time() - float(payload["fetched_at"]) > ttl_seconds:
+            return None
+        models = payload["models"]
+        return [str(name) for name in models] if isinstance(models, list) else None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def store_cached_models(path: str, api_key: str, models: Sequence[str]) -> None:
+    if not path:
+        return
+    payload = {"key": _key_fingerprint(api_key), "fetched_at": time.time(), "models": list(models)}
+    target = Path(path)
+    tmp_path = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    try:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_text(json.dumps(payload), encoding="utf-8")
+        os.replace(tmp_path, target)
+    except OSError:
+        pass
+
+
+# Creates the Gemini client on first use and resolves the model name in the
+# background. Until resolution finishes callers use the configured model name,
+# so nothing on the import or request path waits on models.list().
+class ModelRegistry:
+    def __init__(self, api_key: str, configured_model: str, cache_path: str = "", cache_ttl_seconds: float = 0) -> None:
+        self.api_key = api_key
+        self.configured_model = _normalize_model_name(configured_model)
+        self.cache_path = cache_path
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self._lock = threading.Lock()
+        self._client: object | None = None
+        self._warmup_thread: threading.Thread | None = None
+        self.state = STATE_STARTING if api_key else STATE_DISABLED
+        self.error = "" if api_key else "Missing GEMINI_API_KEY. Using local retrieval fallback only."
+        self.active_model = ""
+        self.resolved_from = ""
+        self.warmup_ms = 0.0
+
+    def client(self) -> object | None:
+        if not self.api_key:
+            return None
+        with self._lock:
+            if self._client is None and self.state != STATE_FAILED:
+                try:
+                    self._client = genai.Client(api_key=self.api_key)
+                except Exception as exc:
+                    self.state = STATE_FAILED
+                    self.error = f"Model initialization error: {exc}"
+            return self._client
+
+    def model_name(self) -> str:
+        return self.active_model or self.configured_model
+
+    def start_warmup(self) -> None:
+        with self._lock:
+            if self.state != STATE_STARTING or self._warmup_thread is not None:
+                return
+            self._warmup_thread = threading.Thread(target=self.warm_up, name="model-warmup", daemon=True)
+            thread = self._warmup_thread
+        thread.start()
+
+    def warm_up(self) -> None:
+        started = time.perf_counter()
+        client = self.client()
+        if client is None:
+            return
+
+        available = load_cached_models(self.cache_path, self.api_key, self.cache_ttl_seconds)
+        source = "cache"
+        if available is None:
+            available = _list_generate_models(client)
+            source = "api"
+            # An empty list usually means a transient listing failure; retry on the next boot.
+            if available:
+                store_cached_models(self.cache_path, self.api_key, available)
+
+        with self._lock:
+            self.active_model = _pick_model(self.configured_model, available)
+            self.resolved_from = source if available else "configured"
+            self.state = STATE_READY
+            self.warmup_ms = (time.perf_counter() - started) * 1000
+
+    def ready(self) -> bool:
+        return self.state != STATE_STARTING
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "ready": self.ready(),
+            "model": self.model_name() if self.api_key else "",
+            "resolved_from": self.resolved_from,
+            "warmup_ms": round(self.warmup_ms, 1),
+            "error": self.error,
+        }
@@ -1,12 +1,65 @@
+import asyncio
+import dataclasses
+import os
 import re
+import threading
 import uuid
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List, Tuple
-
-from google import genai
-
-from app.config import DATA_PATH, GEMINI_API_KEY, MODEL_NAME, TOP_K_CONTEXT_LINES
+from types import MappingProxyType
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Mapping, Tuple
+
+from app.alias_matcher import AliasMatcher
+from app.answer_cache import AnswerCache, SemanticAnswerCache, answer_cache_key
+from app.bill_ledger import BillLedger, LedgerUnavailableError
+from app.config import (
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL_SECONDS,
+    BILL_LEDGER_BATCH_SIZE,
+    BILL_LEDGER_FLUSH_TIMEOUT_SECONDS,
+    BILL_LEDGER_PATH,
+    BM25_B,
+    BM25_K1,
+    DATA_PATH,
+    DENSE_DIMENSIONS,
+    DENSE_MIN_SIMILARITY,
+    GEMINI_API_KEY,
+    IDEMPOTENCY_REPLIES_PER_SESSION,
+    INDEX_SNAPSHOT_DIR,
+    INVOICE_NUMBER_BLOCK_SIZE,
+    INVOICE_NUMBER_PATH,
+    INVOICE_NUMBER_PREFIX,
+    LLM_MAX_IN_FLIGHT,
+    LLM_QUEUE_TIMEOUT_SECONDS,
+    MODEL_LIST_CACHE_PATH,
+    MODEL_LIST_CACHE_TTL_SECONDS,
+    MODEL_NAME,
+    RETRIEVAL_MODE,
+    RETRIEVAL_UNIT,
+    SEMANTIC_CACHE_SIZE,
+    SEMANTIC_CACHE_THRESHOLD,
+    SESSION_BACKEND,
+    SESSION_IDLE_TTL_SECONDS,
+    SESSION_LOCK_STRIPES,
+    SESSION_MAX_ENTRIES,
+    SESSION_REDIS_PREFIX,
+    SESSION_REDIS_URL,
+    SESSION_SQLITE_PATH,
+    SESSION_SWEEP_INTERVAL_SECONDS,
+    SESSION_TOKEN_COMPRESS,
+    SESSION_TOKEN_SECRET,
+    TOP_K_CONTEXT_LINES,
+)
+from app.invoice_numbers import InvoiceNumberAllocator
+from app.kb_snapshot import code_digest, load_snapshot, save_snapshot, source_digest
+from app.llm_limiter import LLMBusyError, LLMLimiter
+from app.model_registry import ModelRegistry
+from app.retrieval import InvertedIndex, reciprocal_rank_fusion
+from app.session_lock import StripedLock
+from app.session_store import SessionState, create_session_store
+from app.session_token import SessionTokenCodec
+from app.single_flight import SingleFlight
+from app.vector_index import HashingVectorizer, VectorIndex, dense_available
 
 STOP_WORDS = {
     "a",
@@ -39,13 +92,6 @@ STOP_WORDS = {
     "your",
 }
 
-PREFERRED_FALLBACK_MODELS = [
-    "gemini-2.5-flash",
-    "gemini-2.0-flash",
-    "gemini-2.0-flash-lite",
-    "gemini-flash-latest",
-]
-
 MENU_KEYWORDS = {"menu", "food", "foods", "item", "items", "dish", "dishes", "price", "prices"}
 HOURS_KEYWORDS = {"hour", "hours", "open", "opening", "close", "closing", "timing", "time"}
 POLICY_KEYWORDS = {"policy", "policies", "rule", "rules", "outside", "delivery"}
@@ -59,11 +105,18 @@ DINE_IN_PHRASES = {"dine in", "dine-in", "dinein", "table", "eat in", "eat-in"}
 DELIVERY_PHRASES = {"online delivery", "home delivery", "delivery", "deliver", "door delivery"}
 SLOT_HINTS = {"breakfast", "lunch", "dinner", "morning", "afternoon", "evening", "night"}
 
+DENSE_RETRIEVAL_MODES = {"dense", "hybrid"}
+# How deep each ranker looks before hybrid mode fuses the two rankings.
+HYBRID_CANDIDATES = 50
+
 GST_RATE = 0.05
 MIN_ADDRESS_LENGTH = 10
 
+SECTION_PREFIXES = ("Opening Hours:", "Menu:", "Policies:")
+MENU_ITEM_LINE_PATTERN = re.compile(r"^\d+\.\s*(.+?)\s*-\s*Rs\s*(\d+)", flags=re.IGNORECASE)
 
-@dataclass
+
+@dataclass(frozen=True)
 class MenuItem:
     name: str
     price: int
@@ -71,6 +124,72 @@ class MenuItem:
     ingredients: str
 
 
+# Everything the order flow needs from the menu, compiled once per knowledge-base version.
+@dataclass(frozen=True)
+class MenuCatalog:
+    items: Tuple[MenuItem, ...]
+    alias_map: Mapping[str, MenuItem]
+    by_name: Mapping[str, MenuItem]
+    by_type: Mapping[str, Tuple[MenuItem, ...]]
+    # alias_items[i] is the item for matcher.aliases[i], in alias_map order.
+    alias_items: Tuple[MenuItem, ...]
+    matcher: AliasMatcher
+    menu_text: str
+
+    # MappingProxyType cannot be pickled, so persist plain dicts and re-wrap on load.
+    def __reduce__(self):
+        return (
+            _restore_menu_catalog,
+            (
+                self.items,
+                dict(self.alias_map),
+                dict(self.by_name),
+                dict(self.by_type),
+                self.alias_items,
+                self.matcher,
+                self.menu_text,
+            ),
+        )
+
+
+def _restore_menu_catalog(
+    items: Tuple[MenuItem, ...],
+    alias_map: Dict[str, MenuItem],
+    by_name: Dict[str, MenuItem],
+    by_type: Dict[str, Tuple[MenuItem, ...]],
+    alias_items: Tuple[MenuItem, ...],
+    matcher: AliasMatcher,
+    menu_text: str,
+) -> MenuCatalog:
+    return MenuCatalog(
+        items=items,
+        alias_map=MappingProxyType(alias_map),
+        by_name=MappingProxyType(by_name),
+        by_type=MappingProxyType(by_type),
+        alias_items=alias_items,
+        matcher=matcher,
+        menu_text=menu_text,
+    )
+
+
+@dataclass(frozen=True)
+class KnowledgeBaseSnapshot:
+    text: str
+    lines: List[str]
+    # (mtime_ns, size, inode) of the source file, or None when it could not be read.
+    version: Tuple[int, int, int] | None
+    menu: MenuCatalog
+    # Retrieval documents: one per line, or one per section/menu item in chunk mode.
+    units: List[Tuple[str, ...]]
+    index: InvertedIndex
+    # Only built for the dense/hybrid retrieval modes when numpy is installed.
+    vectors: VectorIndex | None
+
+    @property
+    def load_error(self) -> bool:
+        return self.text.startswith("DATA_LOAD_ERROR:")
+
+
 def _read_restaurant_text(path: str) -> str:
     try:
         with open(path, "r", encoding="utf-8") as file:
@@ -79,39 +198,152 @@ def _read_restaurant_text(path: str) -> str:
         return f"DATA_LOAD_ERROR: {exc}"
 
 
-def _tokenize(text: str) -> List[str]:
-    return re.findall(r"[a-z0-9]+", text.lower())
+def _build_knowledge_base(
+    text: str,
+    version: Tuple[int, int, int] | None,
+    unit: str = RETRIEVAL_UNIT,
+) -> KnowledgeBaseSnapshot:
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    units = _chunk_knowledge_base(lines) if unit == "chunk" else [(line,) for line in lines]
+    documents = ["\n".join(chunk) for chunk in units]
+    vectors = None
+    if RETRIEVAL_MODE in DENSE_RETRIEVAL_MODES and dense_available():
+        vectors = VectorIndex(documents, HashingVectorizer(DENSE_DIMENSIONS))
+    return KnowledgeBaseSnapshot(
+        text=text,
+        lines=lines,
+        version=version,
+        menu=_build_menu_catalog(lines),
+        units=units,
+        index=InvertedIndex(documents, bm25_k1=BM25_K1, bm25_b=BM25_B),
+        vectors=vectors,
+    )
 
 
-def _normalize_model_name(name: str) -> str:
-    return name.replace("models/", "")
+# Snapshots pickle objects built by these modules, so any change to them invalidates the snapshot.
+_BUILDER_SHA256 = code_digest(
+    os.path.join(os.path.dirname(__file__), name)
+    for name in ("rag_engine.py", "retrieval.py", "alias_matcher.py", "vector_index.py")
+)
 
 
-def _create_client_and_model() -> Tuple[object, str, str]:
-    if not GEMINI_API_KEY:
-        return None, "", "Missing GEMINI_API_KEY. Using local retrieval fallback only."
+def _snapshot_settings(text: str) -> Dict[str, object]:
+    return {
+        "source_sha256": source_digest(text),
+        "builder_sha256": _BUILDER_SHA256,
+        "retrieval_unit": RETRIEVAL_UNIT,
+        "retrieval_mode": RETRIEVAL_MODE,
+        "dense_dimensions": DENSE_DIMENSIONS,
+        "bm25_k1": BM25_K1,
+        "bm25_b": BM25_B,
+    }
 
-    try:
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        available = []
+
+# One parsed snapshot shared by every request; rebuilt only when the data file changes.
+class KnowledgeBaseCache:
+    def __init__(self, path: str, snapshot_dir: str = "") -> None:
+        self.path = path
+        self.snapshot_dir = snapshot_dir
+        self.hits = 0
+        self.reloads = 0
+        self.load_errors = 0
+        self.snapshot_loads = 0
+        self.snapshot_builds = 0
+        self.snapshot_saves = 0
+        self.snapshot_save_errors = 0
+        self._snapshot: KnowledgeBaseSnapshot | None = None
+        self._lock = threading.Lock()
+        self._pending_save: Tuple[KnowledgeBaseSnapshot, Dict[str, object]] | None = None
+        self._saver: threading.Thread | None = None
+
+    def _stat_version(self) -> Tuple[Tuple[int, int, int] | None, str]:
         try:
-            for item in client.models.list():
-                methods = getattr(item, "supported_actions", None)
-                if methods is None or "generateContent" in methods:
-                    available.append(_normalize_model_name(item.name))
-        except Exception:
-            available = []
+            stat = os.stat(self.path)
+        except OSError as exc:
+            return None, f"DATA_LOAD_ERROR: {exc}"
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino), ""
+
+    def get(self) -> KnowledgeBaseSnapshot:
+        version, error_text = self._stat_version()
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and version is not None and snapshot.version == version:
+                self.hits += 1
+                return snapshot
+
+            text = error_text or _read_restaurant_text(self.path)
+            if text.startswith("DATA_LOAD_ERROR:"):
+                self.load_errors += 1
+                # Keep serving the last good snapshot if the file becomes unreadable.
+                if snapshot is not None:
+                    return snapshot
+                return _build_knowledge_base(text, None)
+
+            self._snapshot = self._load_or_build(text, version)
+            self.reloads += 1
+            return self._snapshot
+
+    def _load_or_build(self, text: str, version: Tuple[int, int, int] | None) -> KnowledgeBaseSnapshot:
+        if not self.snapshot_dir:
+            return _build_knowledge_base(text, version)
+
+        settings = _snapshot_settings(text)
+        kb = load_snapshot(self.snapshot_dir, settings, KnowledgeBaseSnapshot)
+        if kb is not None:
+            self.snapshot_loads += 1
+            return dataclasses.replace(kb, version=version)
+
+        kb = _build_knowledge_base(text, version)
+        self.snapshot_builds += 1
+        self._save_later(kb, settings)
+        return kb
+
+    def _save_later(self, kb: KnowledgeBaseSnapshot, settings: Dict[str, object]) -> None:
+        # Called with the lock held. Writing and syncing the snapshot happens on a
+        # background thread once the new build is already being served; if the
+        # file changes again meanwhile, only the newest build is written.
+        self._pending_save = (kb, settings)
+        if self._saver is None:
+            self._saver = threading.Thread(target=self._save_pending, name="kb-snapshot", daemon=True)
+            self._saver.start()
+
+    def _save_pending(self) -> None:
+        while True:
+            with self._lock:
+                pending, self._pending_save = self._pending_save, None
+                if pending is None:
+                    self._saver = None
+                    return
+            try:
+                save_snapshot(self.snapshot_dir, *pending)
+                saved = True
+            except Exception:
+                # Read-only image or full disk: keep serving from memory.
+                saved = False
+            with self._lock:
+                if saved:
+                    self.snapshot_saves += 1
+                else:
+                    self.snapshot_save_errors += 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            version = self._snapshot.version if self._snapshot else None
+            return {
+                "path": self.path,
+                "hits": self.hits,
+                "reloads": self.reloads,
+                "load_errors": self.load_errors,
+                "snapshot_loads": self.snapshot_loads,
+                "snapshot_builds": self.snapshot_builds,
+                "snapshot_saves": self.snapshot_saves,
+                "snapshot_save_errors": self.snapshot_save_errors,
+                "version": list(version) if version else None,
+            }
 
-        candidates = [_normalize_model_name(MODEL_NAME)] + PREFERRED_FALLBACK_MODELS
-        if available:
-            for candidate in candidates:
-                if candidate in available:
-                    return client, candidate, ""
-            return client, available[0], ""
 
-        return client, _normalize_model_name(MODEL_NAME), ""
-    except Exception as exc:
-        return None, "", f"Model initialization error: {exc}"
+def _tokenize(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
 
 
 def _find_line_index(lines: List[str], prefix: str) -> int:
@@ -136,6 +368,29 @@ def _section_between(lines: List[str], start_prefix: str, end_prefixes: Tuple[st
     return lines[start_idx:end_idx]
 
 
+def _chunk_knowledge_base(lines: List[str]) -> List[Tuple[str, ...]]:
+    # Same boundaries _section_between and _extract_menu_items rely on: a chunk per
+    # section header block, with every numbered menu item split into its own chunk.
+    chunks: List[Tuple[str, ...]] = []
+    current: List[str] = []
+    in_menu = False
+    for line in lines:
+        line_lower = line.lower()
+        starts_section = any(line_lower.startswith(prefix.lower()) for prefix in SECTION_PREFIXES)
+        if starts_section:
+            in_menu = line_lower.startswith("menu:")
+        starts_item = in_menu and bool(MENU_ITEM_LINE_PATTERN.match(line))
+
+        if (starts_section or starts_item) and current:
+            chunks.append(tuple(current))
+            current = []
+        current.append(line)
+
+    if current:
+        chunks.append(tuple(current))
+    return chunks
+
+
 def _extract_menu_items(lines: List[str]) -> List[MenuItem]:
     menu_lines = _section_between(lines, "Menu:", ("Policies:",))
     if not menu_lines:
@@ -145,7 +400,7 @@ def _extract_menu_items(lines: List[str]) -> List[MenuItem]:
     current = None
     for raw_line in menu_lines[1:]:
         line = raw_line.strip()
-        match = re.match(r"^\d+\.\s*(.+?)\s*-\s*Rs\s*(\d+)", line, flags=re.IGNORECASE)
+        match = MENU_ITEM_LINE_PATTERN.match(line)
         if match:
             if current:
                 items.append(current)
@@ -195,23 +450,39 @@ def _build_menu_alias_map(menu_items: List[MenuItem]) -> Dict[str, MenuItem]:
     return aliases
 
 
-def _parse_order_from_query(query: str, alias_map: Dict[str, MenuItem]) -> Dict[str, int]:
-    q = query.lower()
-    order: Dict[str, int] = {}
+def _build_menu_catalog(lines: List[str]) -> MenuCatalog:
+    items = tuple(_extract_menu_items(lines))
+    alias_map = _build_menu_alias_map(list(items))
 
-    for alias, item in alias_map.items():
-        alias_pattern = rf"\b{re.escape(alias)}\b"
-        if not re.search(alias_pattern, q):
-            continue
+    by_type: Dict[str, List[MenuItem]] = {}
+    for item in items:
+        by_type.setdefault(item.item_type.lower(), []).append(item)
+
+    return MenuCatalog(
+        items=items,
+        alias_map=MappingProxyType(alias_map),
+        by_name=MappingProxyType({item.name: item for item in items}),
+        by_type=MappingProxyType({key: tuple(values) for key, values in by_type.items()}),
+        alias_items=tuple(alias_map.values()),
+        matcher=AliasMatcher(list(alias_map.keys())),
+        menu_text=_format_menu_list(list(items)),
+    )
+
+
+def _parse_order_from_query(query: str, catalog: MenuCatalog) -> Dict[str, int]:
+    hits = catalog.matcher.scan(query.lower())
+    order: Dict[str, int] = {}
 
+    # Visit aliases in alias_map order so the cart keeps its historical item order.
+    for alias_index in sorted(hits):
+        left, right = hits[alias_index]
         qty = 1
-        left = re.search(rf"(\d+)\s*(?:x\s*)?{alias_pattern}", q)
-        right = re.search(rf"{alias_pattern}\s*(?:x\s*)?(\d+)", q)
-        if left:
-            qty = int(left.group(1))
-        elif right:
-            qty = int(right.group(1))
+        if left is not None:
+            qty = left
+        elif right is not None:
+            qty = right
 
+        item = catalog.alias_items[alias_index]
         order[item.name] = max(order.get(item.name, 0), qty)
 
     return order
@@ -316,8 +587,8 @@ def _mode_label(mode: str) -> str:
     return ""
 
 
-def _order_summary(order: Dict[str, int], menu_items: List[MenuItem], context: Dict[str, str]) -> Tuple[str, int]:
-    menu_by_name = {item.name: item for item in menu_items}
+def _order_summary(order: Dict[str, int], catalog: MenuCatalog, context: Dict[str, str]) -> Tuple[str, int]:
+    menu_by_name = catalog.by_name
     lines = ["Pending Order:"]
     mode_label = _mode_label(context.get("mode", ""))
     if mode_label:
@@ -339,10 +610,16 @@ def _order_summary(order: Dict[str, int], menu_items: List[MenuItem], context: D
     return "\n".join(lines), subtotal
 
 
+def _next_bill_id(issued: datetime) -> str:
+    if invoice_numbers is None:
+        return f"{INVOICE_NUMBER_PREFIX}-{uuid.uuid4().hex[:8].upper()}"
+    return invoice_numbers.allocate(issued)
+
+
 def _generate_bill(
-    order: Dict[str, int], menu_items: List[MenuItem], context: Dict[str, str]
+    order: Dict[str, int], catalog: MenuCatalog, context: Dict[str, str]
 ) -> Tuple[str, Dict[str, object]]:
-    menu_by_name = {item.name: item for item in menu_items}
+    menu_by_name = catalog.by_name
     lines = ["Final Bill:"]
 
     mode_label = _mode_label(context.get("mode", ""))
@@ -374,8 +651,9 @@ def _generate_bill(
 
     gst = round(subtotal * GST_RATE)
     total = subtotal + gst
-    bill_id = f"CN-{uuid.uuid4().hex[:8].upper()}"
-    issued_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    issued = datetime.now()
+    bill_id = _next_bill_id(issued)
+    issued_at = issued.strftime("%Y-%m-%d %H:%M:%S")
 
     lines.append(f"Subtotal: Rs {subtotal}")
     lines.append(f"GST (5%): Rs {gst}")
@@ -407,27 +685,154 @@ def _format_menu_list(menu_items: List[MenuItem]) -> str:
     return "\n".join(lines)
 
 
-restaurant_text = _read_restaurant_text(DATA_PATH)
-restaurant_lines = [line.strip() for line in restaurant_text.splitlines() if line.strip()]
-client, ACTIVE_MODEL_NAME, MODEL_INIT_ERROR = _create_client_and_model()
+knowledge_base_cache = KnowledgeBaseCache(DATA_PATH, INDEX_SNAPSHOT_DIR)
+knowledge_base_cache.get()
+model_registry = ModelRegistry(GEMINI_API_KEY, MODEL_NAME, MODEL_LIST_CACHE_PATH, MODEL_LIST_CACHE_TTL_SECONDS)
+llm_limiter = LLMLimiter(LLM_MAX_IN_FLIGHT, LLM_QUEUE_TIMEOUT_SECONDS)
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS)
+llm_flights = SingleFlight()
+semantic_cache = SemanticAnswerCache(
+    SEMANTIC_CACHE_SIZE,
+    ANSWER_CACHE_TTL_SECONDS,
+    SEMANTIC_CACHE_THRESHOLD,
+    HashingVectorizer(DENSE_DIMENSIONS),
+    stop_words=STOP_WORDS,
+)
+
+# With SESSION_BACKEND=token the client carries its own signed state and nothing is kept server-side.
+session_tokens = (
+    SessionTokenCodec(SESSION_TOKEN_SECRET, SESSION_IDLE_TTL_SECONDS, SESSION_TOKEN_COMPRESS)
+    if SESSION_BACKEND == "token"
+    else None
+)
+session_locks = StripedLock(SESSION_LOCK_STRIPES)
+bill_ledger = BillLedger(BILL_LEDGER_PATH, BILL_LEDGER_BATCH_SIZE) if BILL_LEDGER_PATH else None
+invoice_numbers = (
+    InvoiceNumberAllocator(INVOICE_NUMBER_PATH, INVOICE_NUMBER_BLOCK_SIZE, INVOICE_NUMBER_PREFIX)
+    if INVOICE_NUMBER_PATH
+    else None
+)
+bill_listeners: List[Callable[[str, Dict[str, object]], None]] = []
+session_store = (
+    create_session_store(
+        SESSION_BACKEND,
+        SESSION_MAX_ENTRIES,
+        SESSION_IDLE_TTL_SECONDS,
+        sqlite_path=SESSION_SQLITE_PATH,
+        redis_url=SESSION_REDIS_URL,
+        redis_key_prefix=SESSION_REDIS_PREFIX,
+    )
+    if session_tokens is None
+    else None
+)
+
+
+def release_invoice_numbers() -> None:
+    # Hands reserved but unused invoice numbers back to the shared series on
+    # shutdown; atexit covers exits that skip the lifespan.
+    if invoice_numbers is not None:
+        invoice_numbers.release()
+
+
+def register_bill_listener(listener: Callable[[str, Dict[str, object]], None]) -> None:
+    # Called with (session_id, bill) for each newly confirmed bill once its session state is saved.
+    bill_listeners.append(listener)
+
+
+def _publish_bill(session_id: str, bill: Dict[str, object]) -> None:
+    if bill_ledger is not None:
+        # Only queued here; the ledger's writer thread commits it.
+        bill_ledger.append(session_id, bill)
+    for listener in bill_listeners:
+        try:
+            listener(session_id, bill)
+        except Exception:
+            # Follow-up work (pre-rendering) must never fail the checkout itself.
+            pass
+
+
+def get_latest_bill(session_id: str, state_token: str | None = None) -> Dict[str, object] | None:
+    if session_tokens is not None:
+        session = session_tokens.decode(state_token)
+    else:
+        session = session_store.load(session_id)
+    return session.latest_bill if session is not None else None
+
+
+def get_bill(bill_id: str) -> Tuple[str, Dict[str, object]] | None:
+    # (session_id, bill) for any bill ever confirmed, from the ledger.
+    return bill_ledger.get(bill_id) if bill_ledger is not None else None
+
 
-orders_by_session: Dict[str, Dict[str, int]] = {}
-latest_bill_by_session: Dict[str, Dict[str, object]] = {}
-session_context_by_session: Dict[str, Dict[str, str]] = {}
+def get_session_bills(session_id: str, limit: int = 50) -> List[Dict[str, object]]:
+    return bill_ledger.for_session(session_id, limit) if bill_ledger is not None else []
 
 
-def get_latest_bill(session_id: str) -> Dict[str, object] | None:
-    return latest_bill_by_session.get(session_id)
+def iter_bills(start: str, end: str) -> Iterator[Dict[str, object]]:
+    # Bills issued between two YYYY-MM-DD dates, inclusive.
+    if bill_ledger is not None:
+        if not bill_ledger.flush(BILL_LEDGER_FLUSH_TIMEOUT_SECONDS):
+            raise LedgerUnavailableError("Recent bills are not committed to the ledger yet; try again shortly.")
+        return bill_ledger.between(start, end)
+    # Without the ledger only the latest bill of each live session is kept, and
+    # none at all server-side in token mode.
+    if session_store is None:
+        raise RuntimeError("Bills are not stored server-side with SESSION_BACKEND=token and no BILL_LEDGER_PATH.")
+    return (
+        session.latest_bill
+        for session in session_store.scan()
+        if session.latest_bill and start <= str(session.latest_bill.get("issued_at", ""))[:10] <= end
+    )
+
+
+def start_session_sweeper() -> None:
+    if session_store is not None:
+        session_store.start_sweeper(SESSION_SWEEP_INTERVAL_SECONDS)
+
+
+def compile_knowledge_base_snapshot(force: bool = False) -> str:
+    if not INDEX_SNAPSHOT_DIR:
+        raise SystemExit("INDEX_SNAPSHOT_DIR is empty; nothing to compile.")
+    text = _read_restaurant_text(DATA_PATH)
+    if text.startswith("DATA_LOAD_ERROR:"):
+        raise SystemExit(text)
+
+    settings = _snapshot_settings(text)
+    if force or load_snapshot(INDEX_SNAPSHOT_DIR, settings, KnowledgeBaseSnapshot) is None:
+        save_snapshot(INDEX_SNAPSHOT_DIR, _build_knowledge_base(text, None), settings)
+    return INDEX_SNAPSHOT_DIR
+
 
+def start_model_warmup() -> None:
+    model_registry.start_warmup()
 
-def _get_session_context(session_id: str) -> Dict[str, str]:
-    if session_id not in session_context_by_session:
-        session_context_by_session[session_id] = _default_session_context()
-    return session_context_by_session[session_id]
+
+def get_readiness() -> Dict[str, object]:
+    kb = knowledge_base_cache.get()
+    return {
+        "ready": model_registry.ready() and not kb.load_error,
+        "model": model_registry.stats(),
+        "knowledge_base": {"loaded": not kb.load_error},
+    }
+
+
+def get_engine_metrics() -> Dict[str, object]:
+    return {
+        "knowledge_base": knowledge_base_cache.stats(),
+        "model": model_registry.stats(),
+        "llm": llm_limiter.stats(),
+        "answer_cache": answer_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "llm_coalescing": llm_flights.stats(),
+        "sessions": session_tokens.stats() if session_tokens is not None else session_store.stats(),
+        "session_locks": session_locks.stats(),
+        "bill_ledger": bill_ledger.stats() if bill_ledger is not None else {"enabled": False},
+        "invoice_numbers": invoice_numbers.stats() if invoice_numbers is not None else {"enabled": False},
+    }
 
 
-def _reset_session_context(session_id: str) -> None:
-    session_context_by_session[session_id] = _default_session_context()
+def _new_session() -> SessionState:
+    return SessionState(context=_default_session_context())
 
 
 def _new_response(
@@ -458,56 +863,82 @@ def _new_response(
     return payload
 
 
-def _score_line(line: str, query: str, query_tokens: List[str]) -> int:
-    line_lower = line.lower()
-    line_tokens = set(_tokenize(line))
-    keyword_hits = sum(1 for token in query_tokens if token in line_tokens)
-    phrase_bonus = 2 if query.lower().strip() and query.lower().strip() in line_lower else 0
-    return keyword_hits + phrase_bonus
+def _rank_units(kb: KnowledgeBaseSnapshot, query: str, query_tokens: List[str], top_k: int) -> List[int]:
+    if RETRIEVAL_MODE in DENSE_RETRIEVAL_MODES and kb.vectors is not None:
+        if RETRIEVAL_MODE == "dense":
+            return kb.vectors.top_ids(query, top_k, DENSE_MIN_SIMILARITY)
+        depth = max(top_k, HYBRID_CANDIDATES)
+        lexical = kb.index.bm25_top_ids(query_tokens, depth)
+        dense = kb.vectors.top_ids(query, depth, DENSE_MIN_SIMILARITY)
+        return reciprocal_rank_fusion([lexical, dense], top_k)
 
+    if RETRIEVAL_MODE == "bm25":
+        return kb.index.bm25_top_ids(query_tokens, top_k)
+    return kb.index.top_ids(query, query_tokens, top_k)
 
-def _get_current_restaurant_lines() -> List[str]:
-    current_text = _read_restaurant_text(DATA_PATH)
-    if current_text.startswith("DATA_LOAD_ERROR:"):
-        return restaurant_lines
-    return [line.strip() for line in current_text.splitlines() if line.strip()]
 
-
-def retrieve_context(query: str, top_k: int = TOP_K_CONTEXT_LINES) -> str:
-    lines = _get_current_restaurant_lines()
+def retrieve_context(
+    query: str,
+    top_k: int = TOP_K_CONTEXT_LINES,
+    knowledge_base: KnowledgeBaseSnapshot | None = None,
+) -> str:
+    # top_k is a line budget in every mode, so chunked retrieval keeps the same prompt size.
+    kb = knowledge_base or knowledge_base_cache.get()
+    lines = kb.lines
     if not lines:
-        return restaurant_text
+        return kb.text
 
     query_tokens = [token for token in _tokenize(query) if token not in STOP_WORDS]
     if not query_tokens:
         return "\n".join(lines[:top_k])
 
-    scored: List[Tuple[int, int, str]] = []
-    for idx, line in enumerate(lines):
-        score = _score_line(line, query, query_tokens)
-        if score > 0:
-            scored.append((score, idx, line))
-
-    if not scored:
+    ranked = _rank_units(kb, query, query_tokens, top_k)
+    if not ranked:
         return "\n".join(lines[:top_k])
 
-    top_scored = sorted(scored, key=lambda item: (-item[0], item[1]))[:top_k]
-    selected_indices = sorted({idx for _, idx, _ in top_scored})
-    return "\n".join(lines[i] for i in selected_indices)
-
-
-def _handle_order_flow(
-    query: str,
-    session_id: str,
-    menu_items: List[MenuItem],
-    context: Dict[str, str],
-) -> Dict[str, object]:
+    selected: Dict[int, List[str]] = {}
+    budget = top_k
+    for rank, unit_id in enumerate(ranked):
+        if budget <= 0:
+            break
+        unit = kb.units[unit_id]
+        if len(unit) <= budget:
+            chosen = list(unit)
+        else:
+            # A chunk larger than what is left of the budget gives up its least
+            # relevant lines rather than its place (or its tail) to a weaker chunk.
+            chosen = _best_lines(unit, query_tokens, budget, keep_unmatched=rank == 0)
+        if chosen:
+            selected[unit_id] = chosen
+            budget -= len(chosen)
+
+    return "\n".join(line for unit_id in sorted(selected) for line in selected[unit_id])
+
+
+def _best_lines(unit: Tuple[str, ...], query_tokens: List[str], limit: int, keep_unmatched: bool) -> List[str]:
+    # Up to limit lines of a chunk, in their original order: its heading (first
+    # line) plus the body lines sharing the most query terms, leaving the rest of
+    # the budget to other chunks. When only the heading matches ("policies"), or
+    # nothing does in the top-ranked chunk (a semantic match), the chunk is
+    # taken from the top instead.
+    terms = set(query_tokens)
+    scores = [len(terms.intersection(_tokenize(line))) for line in unit]
+    matched = sorted((idx for idx in range(1, len(unit)) if scores[idx] > 0), key=lambda idx: (-scores[idx], idx))
+    if not matched:
+        return list(unit[:limit]) if scores[0] > 0 or keep_unmatched else []
+    if limit == 1:
+        return [unit[0] if scores[0] >= scores[matched[0]] else unit[matched[0]]]
+    return [unit[idx] for idx in sorted([0] + matched[: limit - 1])]
+
+
+def _handle_order_flow(query: str, session: SessionState, catalog: MenuCatalog) -> Dict[str, object]:
     tokens = set(_tokenize(query))
-    pending = dict(orders_by_session.get(session_id, {}))
+    context = session.context
+    pending = dict(session.order)
 
     if tokens & CANCEL_KEYWORDS:
         if pending:
-            orders_by_session.pop(session_id, None)
+            session.order = {}
             if context.get("mode") == "delivery" and context.get("stage") == "await_address":
                 context["stage"] = "ordering"
             return _new_response("Pending order cancelled.", kind="order_cancelled", context=context)
@@ -537,7 +968,7 @@ def _handle_order_flow(
 
         if context["mode"] == "delivery" and not context.get("address"):
             context["stage"] = "await_address"
-            summary, subtotal = _order_summary(pending, menu_items, context)
+            summary, subtotal = _order_summary(pending, catalog, context)
             return _new_response(
                 summary + "\nPlease share complete delivery address to generate final bill.",
                 kind="address_required",
@@ -546,24 +977,23 @@ def _handle_order_flow(
                 context=context,
             )
 
-        bill_text, bill_data = _generate_bill(pending, menu_items, context)
-        orders_by_session.pop(session_id, None)
-        latest_bill_by_session[session_id] = bill_data
-        _reset_session_context(session_id)
+        bill_text, bill_data = _generate_bill(pending, catalog, context)
+        session.order = {}
+        session.latest_bill = bill_data
+        session.context = _default_session_context()
         return _new_response(
             bill_text,
             kind="bill",
             total=int(bill_data["total"]),
             bill_id=str(bill_data["bill_id"]),
-            context=_get_session_context(session_id),
+            context=session.context,
         )
 
-    menu_alias_map = _build_menu_alias_map(menu_items)
-    parsed = _parse_order_from_query(query, menu_alias_map)
+    parsed = _parse_order_from_query(query, catalog)
 
     if not parsed:
         if (tokens & ORDER_KEYWORDS) and pending:
-            summary, subtotal = _order_summary(pending, menu_items, context)
+            summary, subtotal = _order_summary(pending, catalog, context)
             return _new_response(summary, kind="pending_order", order_pending=True, total=subtotal, context=context)
 
         if tokens & ORDER_KEYWORDS:
@@ -593,24 +1023,25 @@ def _handle_order_flow(
     if "add" in tokens and pending:
         for item_name, qty in parsed.items():
             pending[item_name] = pending.get(item_name, 0) + qty
-        orders_by_session[session_id] = pending
+        session.order = pending
     else:
-        orders_by_session[session_id] = parsed
+        session.order = parsed
 
     context["stage"] = "ordering"
-    summary, subtotal = _order_summary(orders_by_session[session_id], menu_items, context)
+    summary, subtotal = _order_summary(session.order, catalog, context)
     return _new_response(summary, kind="pending_order", order_pending=True, total=subtotal, context=context)
 
 
-def _rule_based_response(query: str, session_id: str, lines: List[str]) -> Dict[str, object]:
+def _rule_based_response(query: str, session: SessionState, kb: KnowledgeBaseSnapshot) -> Dict[str, object]:
     tokens = set(_tokenize(query))
-    menu_items = _extract_menu_items(lines)
-    context = _get_session_context(session_id)
+    catalog = kb.menu
+    lines = kb.lines
+    context = session.context
 
     service_mode = _detect_service_mode(query)
     if service_mode:
-        if orders_by_session.get(session_id) and service_mode != context.get("mode"):
-            orders_by_session.pop(session_id, None)
+        if session.order and service_mode != context.get("mode"):
+            session.order = {}
 
         if service_mode == "dine_in":
             context["mode"] = "dine_in"
@@ -660,7 +1091,7 @@ def _rule_based_response(query: str, session_id: str, lines: List[str]) -> Dict[
 
     if context["stage"] == "await_address":
         if tokens & CANCEL_KEYWORDS:
-            orders_by_session.pop(session_id, None)
+            session.order = {}
             context["stage"] = "ordering"
             context["address"] = ""
             return _new_response("Pending order cancelled.", kind="order_cancelled", context=context)
@@ -669,18 +1100,18 @@ def _rule_based_response(query: str, session_id: str, lines: List[str]) -> Dict[
             context["address"] = query.strip()
             context["stage"] = "ordering"
 
-            pending = dict(orders_by_session.get(session_id, {}))
+            pending = dict(session.order)
             if pending:
-                bill_text, bill_data = _generate_bill(pending, menu_items, context)
-                orders_by_session.pop(session_id, None)
-                latest_bill_by_session[session_id] = bill_data
-                _reset_session_context(session_id)
+                bill_text, bill_data = _generate_bill(pending, catalog, context)
+                session.order = {}
+                session.latest_bill = bill_data
+                session.context = _default_session_context()
                 return _new_response(
                     bill_text,
                     kind="bill",
                     total=int(bill_data["total"]),
                     bill_id=str(bill_data["bill_id"]),
-                    context=_get_session_context(session_id),
+                    context=session.context,
                 )
 
             return _new_response("Address saved. You can continue ordering.", context=context)
@@ -704,12 +1135,12 @@ def _rule_based_response(query: str, session_id: str, lines: List[str]) -> Dict[
             return _new_response("Hello. Is this for Dine-In or Online Delivery?", context=context)
         return _new_response("Hello. You can now choose Veg/Non-Veg and place your order.", context=context)
 
-    order_response = _handle_order_flow(query, session_id, menu_items, context)
+    order_response = _handle_order_flow(query, session, catalog)
     if order_response["answer"]:
         return order_response
 
     if tokens & MENU_KEYWORDS:
-        return _new_response(_format_menu_list(menu_items), kind="menu", context=context)
+        return _new_response(catalog.menu_text, kind="menu", context=context)
 
     if tokens & HOURS_KEYWORDS:
         hours_lines = _section_between(lines, "Opening Hours:", ("Menu:", "Policies:"))
@@ -724,51 +1155,312 @@ def _rule_based_response(query: str, session_id: str, lines: List[str]) -> Dict[
     return _new_response("", context=context)
 
 
-def ask_question(query: str, session_id: str = "default") -> Dict[str, object]:
-    question = query.strip()
-    context = _get_session_context(session_id)
+@dataclass
+class _Turn:
+    question: str
+    context: Dict[str, str]
+    kb: KnowledgeBaseSnapshot | None = None
+    response: Dict[str, object] | None = None
+    client: object | None = None
+    model: str = ""
+    prompt: str = ""
+    cache_key: Tuple[str, str, str] | None = None
+    state_token: str = ""
+    bill: Dict[str, object] | None = None
+    session_id: str = ""
+    idempotency_key: str = ""
+    # Set once the response is a real model (or answer-cache) answer worth replaying.
+    answered: bool = False
+
+
+def _load_session(session_id: str, state_token: str | None) -> SessionState:
+    if session_tokens is not None:
+        return session_tokens.decode(state_token) or _new_session()
+    return session_store.load(session_id) or _new_session()
+
+
+def _store_session(turn: _Turn, session_id: str, session: SessionState) -> None:
+    # The single write for a turn: the model call that may follow never changes session state.
+    if session_tokens is not None:
+        turn.state_token = session_tokens.encode(session)
+    else:
+        session_store.save(session_id, session)
 
-    if not question:
-        return _new_response("Please enter a valid question.", context=context)
 
-    if restaurant_text.startswith("DATA_LOAD_ERROR:"):
-        return _new_response(restaurant_text, context=context)
+def _with_state_token(turn: _Turn, response: Dict[str, object]) -> Dict[str, object]:
+    if not turn.state_token:
+        return response
+    return {**response, "state_token": turn.state_token}
+
 
-    current_lines = _get_current_restaurant_lines()
-    direct = _rule_based_response(question, session_id, current_lines)
+def _keeps_replies(turn: _Turn) -> bool:
+    return bool(turn.idempotency_key) and session_tokens is None and IDEMPOTENCY_REPLIES_PER_SESSION > 0
+
+
+def _run_state_machine(
+    question: str, session_id: str, state_token: str | None, idempotency_key: str | None
+) -> _Turn:
+    session = _load_session(session_id, state_token)
+    turn = _Turn(
+        question=question, context=session.context, session_id=session_id, idempotency_key=idempotency_key or ""
+    )
+    if _keeps_replies(turn):
+        replayed = session.replay(turn.idempotency_key, question)
+        if replayed is not None:
+            # A retry of a finished request: no transition, no bill, no model call, no write.
+            turn.response = replayed
+            return turn
+
+    if not question:
+        _store_session(turn, session_id, session)
+        turn.response = _new_response("Please enter a valid question.", context=turn.context)
+        return turn
+
+    turn.kb = knowledge_base_cache.get()
+    if turn.kb.load_error:
+        _store_session(turn, session_id, session)
+        turn.response = _new_response(turn.kb.text, context=turn.context)
+        return turn
+
+    direct = _rule_based_response(question, session, turn.kb)
+    if direct["kind"] == "bill":
+        turn.bill = session.latest_bill
+    if direct["answer"] and _keeps_replies(turn):
+        # Saved with the transition itself, so a retried "confirm" can never bill twice.
+        session.remember_reply(turn.idempotency_key, question, direct, IDEMPOTENCY_REPLIES_PER_SESSION)
+    _store_session(turn, session_id, session)
     if direct["answer"]:
-        return direct
+        turn.response = direct
+    return turn
+
 
-    if client is None:
-        context_text = retrieve_context(question, top_k=8)
+def _begin_turn(
+    query: str, session_id: str, state_token: str | None = None, idempotency_key: str | None = None
+) -> _Turn:
+    # Everything up to the model call: validation, rule-based answers and
+    # fallbacks. turn.response is set when no model call is needed.
+    question = query.strip()
+    if session_tokens is not None:
+        # The client owns token state; there is nothing shared to lock.
+        turn = _run_state_machine(question, session_id, state_token, idempotency_key)
+    else:
+        # Load, transition and save run as one unit per session, so a double-tapped
+        # "confirm" bills once and parallel cart edits are never lost.
+        with session_locks.hold(session_id), session_store.transaction(session_id):
+            turn = _run_state_machine(question, session_id, state_token, idempotency_key)
+    if turn.bill is not None:
+        _publish_bill(session_id, turn.bill)
+    if turn.response is not None:
+        return turn
+
+    # Lazy callers (scripts, tests) kick off resolution here; the request itself
+    # uses the configured model name until it completes.
+    model_registry.start_warmup()
+    turn.client = model_registry.client()
+    if turn.client is None:
+        context_text = retrieve_context(question, top_k=8, knowledge_base=turn.kb)
         fallback = (
-            f"I could not use the model right now ({MODEL_INIT_ERROR}).\n{context_text}"
-            if MODEL_INIT_ERROR
+            f"I could not use the model right now ({model_registry.error}).\n{context_text}"
+            if model_registry.error
             else context_text
         )
-        return _new_response(fallback, context=context)
+        turn.response = _new_response(fallback, context=turn.context)
+    return turn
+
+
+async def _begin_turn_async(
+    query: str, session_id: str, state_token: str | None = None, idempotency_key: str | None = None
+) -> _Turn:
+    # In-memory turns are microseconds and stay on the event loop; turns that
+    # wait on SQLite or Redis (including their cross-process locks), or that
+    # could have to reserve invoice numbers from the shared file, move to a thread.
+    if (session_store is not None and session_store.blocking_io) or (
+        invoice_numbers is not None and not invoice_numbers.ready()
+    ):
+        return await asyncio.to_thread(_begin_turn, query, session_id, state_token, idempotency_key)
+    return _begin_turn(query, session_id, state_token, idempotency_key)
+
+
+def _remember_reply(turn: _Turn, response: Dict[str, object]) -> None:
+    # Model answers arrive after the turn's state was saved, so they are recorded
+    # for replays in a second short write. Busy/quota fallbacks are not recorded:
+    # a retry of those should get a real answer.
+    if not turn.answered or not _keeps_replies(turn):
+        return
+    with session_locks.hold(turn.session_id), session_store.transaction(turn.session_id):
+        session = session_store.load(turn.session_id)
+        if session is None:
+            return
+        session.remember_reply(turn.idempotency_key, turn.question, response, IDEMPOTENCY_REPLIES_PER_SESSION)
+        session_store.save(turn.session_id, session)
+
+
+async def _remember_reply_async(turn: _Turn, response: Dict[str, object]) -> None:
+    if session_store is not None and session_store.blocking_io and turn.answered and _keeps_replies(turn):
+        await asyncio.to_thread(_remember_reply, turn, response)
+    else:
+        _remember_reply(turn, response)
 
-    context_text = retrieve_context(question)
-    prompt = (
+
+def _prepare_llm_call(turn: _Turn) -> Dict[str, object] | None:
+    # Builds the prompt and returns the cached answer when this question was
+    # already answered from the same context by the same model.
+    context_text = retrieve_context(turn.question, knowledge_base=turn.kb)
+    turn.model = model_registry.model_name()
+    turn.prompt = (
         "You are a restaurant assistant. "
         "Answer only from the provided context. "
         "If answer is missing, say: I could not find that in the restaurant data.\n\n"
         f"Context:\n{context_text}\n\n"
-        f"Question: {question}"
+        f"Question: {turn.question}"
     )
 
+    answer_cache.bind(turn.kb.version)
+    semantic_cache.bind(turn.kb.version)
+    turn.cache_key = answer_cache_key(turn.question, context_text, turn.model)
+    cached = answer_cache.get(turn.cache_key)
+    if cached is None:
+        # Paraphrases only match answers given for the same context hash and model.
+        cached = semantic_cache.lookup(turn.question, turn.cache_key[1:])
+    if cached is not None:
+        turn.answered = True
+        return _new_response(cached, context=turn.context)
+    return None
+
+
+def _remember_answer(turn: _Turn, answer: str) -> None:
+    answer_cache.put(turn.cache_key, answer)
+    semantic_cache.put(turn.question, turn.cache_key[1:], answer)
+
+
+def _llm_answer_response(turn: _Turn, response: object) -> Dict[str, object]:
+    answer = (getattr(response, "text", "") or "").strip()
+    turn.answered = True
+    if answer:
+        _remember_answer(turn, answer)
+        return _new_response(answer, context=turn.context)
+    return _new_response("I could not find that in the restaurant data.", context=turn.context)
+
+
+def _llm_error_response(turn: _Turn, exc: Exception) -> Dict[str, object]:
+    if isinstance(exc, LLMBusyError):
+        context_text = retrieve_context(turn.question, top_k=8, knowledge_base=turn.kb)
+        return _new_response(f"Model is busy right now.\n{context_text}", context=turn.context)
+    error_text = str(exc).lower()
+    if "quota" in error_text or "429" in error_text or "rate" in error_text:
+        context_text = retrieve_context(turn.question, top_k=8, knowledge_base=turn.kb)
+        return _new_response(f"Model quota exceeded.\n{context_text}", context=turn.context)
+    if "404" in error_text or "not found" in error_text:
+        context_text = retrieve_context(turn.question, top_k=8, knowledge_base=turn.kb)
+        return _new_response(f"Model is unavailable.\n{context_text}", context=turn.context)
+    return _new_response("I could not find that in the restaurant data.", context=turn.context)
+
+
+def _complete_turn(turn: _Turn) -> Dict[str, object]:
+    if turn.response is not None:
+        return turn.response
+
+    cached = _prepare_llm_call(turn)
+    if cached is not None:
+        return cached
+
+    # Concurrent sessions asking the same thing share one model call.
+    try:
+        response = llm_flights.do(
+            (turn.model, turn.prompt),
+            lambda: turn.client.models.generate_content(model=turn.model, contents=turn.prompt),
+        )
+    except Exception as exc:
+        return _llm_error_response(turn, exc)
+    return _llm_answer_response(turn, response)
+
+
+async def _complete_turn_async(turn: _Turn) -> Dict[str, object]:
+    # Same behaviour as _complete_turn, but the model call awaits the async client
+    # under llm_limiter instead of holding a worker thread for its whole duration.
+    if turn.response is not None:
+        return turn.response
+
+    cached = _prepare_llm_call(turn)
+    if cached is not None:
+        return cached
+
+    async def generate() -> object:
+        async with llm_limiter.slot():
+            return await turn.client.aio.models.generate_content(model=turn.model, contents=turn.prompt)
+
+    # Followers of an in-flight identical prompt wait on it without taking a limiter slot.
+    try:
+        response = await llm_flights.do_async((turn.model, turn.prompt), generate)
+    except Exception as exc:
+        return _llm_error_response(turn, exc)
+    return _llm_answer_response(turn, response)
+
+
+async def _stream_turn(turn: _Turn) -> AsyncIterator[Tuple[str, Dict[str, object]]]:
+    if turn.response is not None:
+        yield "delta", {"text": turn.response["answer"]}
+        yield "done", turn.response
+        return
+
+    cached = _prepare_llm_call(turn)
+    if cached is not None:
+        yield "delta", {"text": cached["answer"]}
+        yield "done", cached
+        return
+
+    parts: List[str] = []
     try:
-        response = client.models.generate_content(model=ACTIVE_MODEL_NAME, contents=prompt)
-        answer = (getattr(response, "text", "") or "").strip()
-        if answer:
-            return _new_response(answer, context=context)
-        return _new_response("I could not find that in the restaurant data.", context=context)
+        async with llm_limiter.slot():
+            stream = await turn.client.aio.models.generate_content_stream(model=turn.model, contents=turn.prompt)
+            async for chunk in stream:
+                text = getattr(chunk, "text", "") or ""
+                if text:
+                    parts.append(text)
+                    yield "delta", {"text": text}
     except Exception as exc:
-        error_text = str(exc).lower()
-        if "quota" in error_text or "429" in error_text or "rate" in error_text:
-            context_text = retrieve_context(question, top_k=8)
-            return _new_response(f"Model quota exceeded.\n{context_text}", context=context)
-        if "404" in error_text or "not found" in error_text:
-            context_text = retrieve_context(question, top_k=8)
-            return _new_response(f"Model is unavailable.\n{context_text}", context=context)
-        return _new_response("I could not find that in the restaurant data.", context=context)
+        response = _llm_error_response(turn, exc)
+        if not parts:
+            yield "delta", {"text": response["answer"]}
+        yield "done", response
+        return
+
+    answer = "".join(parts).strip()
+    turn.answered = True
+    if answer:
+        _remember_answer(turn, answer)
+    response = _new_response(answer or "I could not find that in the restaurant data.", context=turn.context)
+    if not answer:
+        yield "delta", {"text": response["answer"]}
+    yield "done", response
+
+
+def ask_question(
+    query: str, session_id: str = "default", state_token: str | None = None, idempotency_key: str | None = None
+) -> Dict[str, object]:
+    turn = _begin_turn(query, session_id, state_token, idempotency_key)
+    response = _complete_turn(turn)
+    _remember_reply(turn, response)
+    return _with_state_token(turn, response)
+
+
+async def ask_question_async(
+    query: str, session_id: str = "default", state_token: str | None = None, idempotency_key: str | None = None
+) -> Dict[str, object]:
+    turn = await _begin_turn_async(query, session_id, state_token, idempotency_key)
+    response = await _complete_turn_async(turn)
+    await _remember_reply_async(turn, response)
+    return _with_state_token(turn, response)
+
+
+async def stream_question(
+    query: str, session_id: str = "default", state_token: str | None = None, idempotency_key: str | None = None
+) -> AsyncIterator[Tuple[str, Dict[str, object]]]:
+    # Yields ("delta", {"text": ...}) events as model tokens arrive, then one
+    # ("done", response) event with the same payload ask_question returns. The
+    # done answer is authoritative: it replaces partial text after a mid-stream error.
+    turn = await _begin_turn_async(query, session_id, state_token, idempotency_key)
+    async for event, data in _stream_turn(turn):
+        if event == "done":
+            await _remember_reply_async(turn, data)
+        yield event, _with_state_token(turn, data) if event == "done" else data
@@ -0,0 +1,247 @@
+import heapq
+import math
+import re
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Sequence, Set, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+PHRASE_BONUS = 2
+BITMAP_CACHE_SIZE = 2048
+# The most frequent terms are the expensive ones to turn into bitmaps, so build them up front.
+PREBUILT_BITMAPS = 256
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+# Sorts after every character the tokenizer can emit.
+_VOCAB_SENTINEL = "\uffff"
+
+
+def _prefix_range(sorted_terms: Sequence[str], prefix: str) -> Tuple[int, int]:
+    return bisect_left(sorted_terms, prefix), bisect_left(sorted_terms, prefix + _VOCAB_SENTINEL)
+
+
+def _trigrams(term: str) -> Set[str]:
+    return {term[i : i + 3] for i in range(len(term) - 2)}
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], top_k: int, k: int = RRF_K) -> List[int]:
+    # Fuses rankers whose raw scores are not comparable (BM25 vs cosine) by rank alone.
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused, key=lambda doc_id: (-fused[doc_id], doc_id))[:top_k]
+
+
+def _mask_from_ids(doc_ids: Iterable[int]) -> int:
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return 0
+    bits = bytearray((max(doc_ids) >> 3) + 1)
+    for doc_id in doc_ids:
+        bits[doc_id >> 3] |= 1 << (doc_id & 7)
+    return int.from_bytes(bits, "little")
+
+
+# Token -> document-id postings over knowledge-base documents (lines or chunks),
+# built once per snapshot. Keyword scores match the historical linear scan: one
+# point per query token present in the document plus PHRASE_BONUS when the whole
+# query is a substring of it.
+# Postings are combined as int bitmaps so set algebra runs in C word-sized steps.
+# The same postings also carry the document-frequency statistics for BM25 ranking.
+class InvertedIndex:
+    def __init__(self, documents: Sequence[str], bm25_k1: float = BM25_K1, bm25_b: float = BM25_B) -> None:
+        self.size = len(documents)
+        self.lowered: List[str] = [document.lower() for document in documents]
+        self.doc_lengths: List[int] = []
+        # Term frequencies above 1 are rare in short documents, so only those are stored.
+        self._repeated_tf: Dict[Tuple[str, int], int] = {}
+
+        postings: Dict[str, List[int]] = {}
+        for doc_id, document in enumerate(self.lowered):
+            counts = Counter(TOKEN_PATTERN.findall(document))
+            self.doc_lengths.append(sum(counts.values()))
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append(doc_id)
+                if tf > 1:
+                    self._repeated_tf[(token, doc_id)] = tf
+        self.postings: Dict[str, Tuple[int, ...]] = {token: tuple(ids) for token, ids in postings.items()}
+
+        self.bm25_k1 = bm25_k1
+        self.bm25_b = bm25_b
+        self.avg_doc_length = sum(self.doc_lengths) / self.size if self.size else 0.0
+        self.idf: Dict[str, float] = {
+            token: math.log(1 + (self.size - len(ids) + 0.5) / (len(ids) + 0.5)) for token, ids in self.postings.items()
+        }
+        self._dense_bitmaps: Dict[str, int] = {
+            token: self._build_bitmap(token)
+            for token in heapq.nlargest(PREBUILT_BITMAPS, self.postings, key=lambda term: len(self.postings[term]))
+        }
+
+        # Vocabulary views used to find documents where the query phrase starts or ends mid-token.
+        self._vocab = sorted(self.postings)
+        self._reversed_vocab = sorted(token[::-1] for token in self.postings)
+        trigram_terms: Dict[str, Set[str]] = {}
+        for token in self._vocab:
+            for trigram in _trigrams(token):
+                trigram_terms.setdefault(trigram, set()).add(token)
+        self._trigram_terms: Dict[str, FrozenSet[str]] = {
+            trigram: frozenset(terms) for trigram, terms in trigram_terms.items()
+        }
+        self._init_caches()
+
+    def _init_caches(self) -> None:
+        self._cached_bitmap = lru_cache(maxsize=BITMAP_CACHE_SIZE)(self._build_bitmap)
+        self._fragment_bitmap = lru_cache(maxsize=BITMAP_CACHE_SIZE)(self._build_fragment_bitmap)
+        self._bm25_impacts = lru_cache(maxsize=BITMAP_CACHE_SIZE)(self._build_bm25_impacts)
+
+    # Caches are rebuilt after unpickling; everything else is persisted as-is.
+    def __getstate__(self) -> Dict[str, object]:
+        state = dict(self.__dict__)
+        for name in ("_cached_bitmap", "_fragment_bitmap", "_bm25_impacts"):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        self.__dict__.update(state)
+        self._init_caches()
+
+    def _bitmap(self, token: str) -> int:
+        mask = self._dense_bitmaps.get(token)
+        return mask if mask is not None else self._cached_bitmap(token)
+
+    def _build_bitmap(self, token: str) -> int:
+        return _mask_from_ids(self.postings[token])
+
+    def _build_bm25_impacts(self, token: str) -> Dict[int, float]:
+        idf = self.idf[token]
+        k1 = self.bm25_k1
+        length_weight = self.bm25_b / self.avg_doc_length if self.avg_doc_length else 0.0
+        impacts: Dict[int, float] = {}
+        for doc_id in self.postings[token]:
+            tf = self._repeated_tf.get((token, doc_id), 1)
+            norm = k1 * (1 - self.bm25_b + length_weight * self.doc_lengths[doc_id])
+            impacts[doc_id] = idf * tf * (k1 + 1) / (tf + norm)
+        return impacts
+
+    def _build_fragment_bitmap(self, fragment: str) -> int:
+        # A bare token is inside every document whose vocabulary contains it as a substring.
+        return _mask_from_ids(self._postings_union(self._terms_containing(fragment)))
+
+    def top_ids(self, query: str, query_tokens: Sequence[str], top_k: int) -> List[int]:
+        # Ids of the top_k scored documents ordered by (score desc, document id asc).
+        weights = Counter(token for token in query_tokens if token in self.postings)
+        terms = [(self._bitmap(token), weight) for token, weight in weights.items()]
+        phrase_mask = self._phrase_bitmap(query)
+        if phrase_mask:
+            terms.append((phrase_mask, PHRASE_BONUS))
+
+        # levels[score] is the bitmap of documents with exactly that score.
+        levels: Dict[int, int] = {}
+        seen = 0
+        for mask, weight in terms:
+            next_levels: Dict[int, int] = {}
+            for score, members in levels.items():
+                hit = members & mask
+                if hit:
+                    next_levels[score + weight] = next_levels.get(score + weight, 0) | hit
+                miss = members & ~mask
+                if miss:
+                    next_levels[score] = next_levels.get(score, 0) | miss
+            fresh = mask & ~seen
+            if fresh:
+                next_levels[weight] = next_levels.get(weight, 0) | fresh
+            seen |= mask
+            levels = next_levels
+
+        selected: List[int] = []
+        for score in sorted(levels, reverse=True):
+            members = levels[score]
+            while members and len(selected) < top_k:
+                lowest = members & -members
+                selected.append(lowest.bit_length() - 1)
+                members ^= lowest
+            if len(selected) >= top_k:
+                break
+        return selected
+
+    def bm25_top_ids(self, query_tokens: Sequence[str], top_k: int) -> List[int]:
+        # Ids of the top_k documents by BM25 score, ties kept in document order.
+        scores: Dict[int, float] = {}
+        for token in query_tokens:
+            if token not in self.postings:
+                continue
+            impacts = self._bm25_impacts(token)
+            if not scores:
+                scores = dict(impacts)
+                continue
+            for doc_id, impact in impacts.items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + impact
+        if not scores or top_k <= 0:
+            return []
+
+        # Find the k-th best score over bare floats, then order only the documents above it.
+        # Equal-length documents tie often, so the boundary score keeps its earliest ones.
+        threshold = heapq.nlargest(top_k, scores.values())[-1]
+        survivors = [doc_id for doc_id, score in scores.items() if score >= threshold]
+        above = [doc_id for doc_id in survivors if scores[doc_id] > threshold]
+        tied = [doc_id for doc_id in survivors if scores[doc_id] == threshold]
+        above.sort(key=lambda doc_id: (-scores[doc_id], doc_id))
+        return above + heapq.nsmallest(top_k - len(above), tied)
+
+    def _phrase_bitmap(self, query: str) -> int:
+        phrase = query.lower().strip()
+        if not phrase:
+            return 0
+        if TOKEN_PATTERN.fullmatch(phrase):
+            return self._fragment_bitmap(phrase)
+        return _mask_from_ids(
+            doc_id for doc_id in self._phrase_candidates(phrase) if phrase in self.lowered[doc_id]
+        )
+
+    def _postings_union(self, terms: Iterable[str]) -> Set[int]:
+        doc_ids: Set[int] = set()
+        for term in terms:
+            doc_ids.update(self.postings[term])
+        return doc_ids
+
+    def _terms_with_prefix(self, prefix: str) -> List[str]:
+        lo, hi = _prefix_range(self._vocab, prefix)
+        return self._vocab[lo:hi]
+
+    def _terms_with_suffix(self, suffix: str) -> List[str]:
+        lo, hi = _prefix_range(self._reversed_vocab, suffix[::-1])
+        return [term[::-1] for term in self._reversed_vocab[lo:hi]]
+
+    def _terms_containing(self, fragment: str) -> List[str]:
+        if len(fragment) < 3:
+            return [term for term in self._vocab if fragment in term]
+
+        pools = sorted((self._trigram_terms.get(trigram, frozenset()) for trigram in _trigrams(fragment)), key=len)
+        return [term for term in pools[0] if fragment in term and all(term in pool for pool in pools[1:])]
+
+    def _phrase_candidates(self, phrase: str) -> Iterable[int]:
+        # A document containing the phrase must contain every token the phrase fully
+        # encloses; tokens touching the phrase edges may be cut mid-token.
+        spans = [(match.start(), match.end(), match.group()) for match in TOKEN_PATTERN.finditer(phrase)]
+        if not spans:
+            return range(self.size)
+
+        enclosed = [token for start, end, token in spans if start > 0 and end < len(phrase)]
+        if enclosed:
+            return min((self.postings.get(token, ()) for token in enclosed), key=len)
+
+        first_start, _, first = spans[0]
+        _, last_end, last = spans[-1]
+        if len(spans) == 1 and first_start == 0 and last_end == len(phrase):
+            return self._postings_union(self._terms_containing(first))
+        if len(spans) == 1 and first_start == 0:
+            return self._postings_union(self._terms_with_suffix(first))
+        if len(spans) == 1:
+            return self._postings_union(self._terms_with_prefix(last))
+
+        suffix_terms = self._terms_with_suffix(first)
+        prefix_terms = self._terms_with_prefix(last)
+        return self._postings_union(min(suffix_terms, prefix_terms, key=len))
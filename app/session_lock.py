@@ -0,0 +1,66 @@
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+
+# A fixed pool of locks shared by all sessions: a session always maps to the
+# same stripe, so its turns run one at a time, while memory stays constant no
+# matter how many sessions exist. Two sessions only wait on each other when
+# they hash to the same stripe, which stripe_collisions counts separately from
+# genuine same-session contention.
+class StripedLock:
+    def __init__(self, stripes: int) -> None:
+        self.stripes = max(1, stripes)
+        self._locks: List[threading.Lock] = [threading.Lock() for _ in range(self.stripes)]
+        self._holders: List[str | None] = [None] * self.stripes
+        self._stats_lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.stripe_collisions = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _stripe(self, key: str) -> int:
+        # crc32 rather than hash(): stable across processes, so stats are comparable between workers.
+        return zlib.crc32(key.encode("utf-8")) % self.stripes
+
+    @contextmanager
+    def hold(self, key: str) -> Iterator[None]:
+        index = self._stripe(key)
+        lock = self._locks[index]
+        waited = 0.0
+        collision = False
+        contended = not lock.acquire(blocking=False)
+        if contended:
+            holder = self._holders[index]
+            collision = holder is not None and holder != key
+            started = time.perf_counter()
+            lock.acquire()
+            waited = time.perf_counter() - started
+
+        self._holders[index] = key
+        with self._stats_lock:
+            self.acquisitions += 1
+            if contended:
+                self.contended += 1
+                self.stripe_collisions += collision
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        try:
+            yield
+        finally:
+            self._holders[index] = None
+            lock.release()
+
+    def stats(self) -> Dict[str, object]:
+        with self._stats_lock:
+            return {
+                "stripes": self.stripes,
+                "acquisitions": self.acquisitions,
+                "contended": self.contended,
+                "stripe_collisions": self.stripe_collisions,
+                "wait_ms_total": round(self.wait_seconds * 1000, 3),
+                "wait_ms_max": round(self.max_wait_seconds * 1000, 3),
+            }
@@ -0,0 +1,441 @@
+import copy
+import json
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+try:
+    import redis
+except ImportError:  # Only needed for SESSION_BACKEND=redis.
+    redis = None
+
+SIZE_SAMPLE = 64
+SCAN_PAGE_SIZE = 500
+# "token" keeps no server-side store at all; see app.session_token.
+SESSION_BACKENDS = ("memory", "sqlite", "redis", "token")
+
+
+@dataclass
+class SessionState:
+    context: Dict[str, str]
+    order: Dict[str, int] = field(default_factory=dict)
+    latest_bill: Dict[str, object] | None = None
+    # Responses to recent idempotency keys, oldest first: {key: {"question": ..., "response": ...}}.
+    replies: Dict[str, Dict[str, object]] = field(default_factory=dict)
+
+    def remember_reply(self, key: str, question: str, response: Dict[str, object], limit: int) -> None:
+        self.replies.pop(key, None)
+        self.replies[key] = {"question": question, "response": dict(response)}
+        while len(self.replies) > max(0, limit):
+            del self.replies[next(iter(self.replies))]
+
+    def replay(self, key: str, question: str) -> Dict[str, object] | None:
+        # A reused key with a different question is a new request, not a retry.
+        entry = self.replies.get(key)
+        if entry is None or entry["question"] != question:
+            return None
+        return entry["response"]
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), separators=(",", ":"))
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, object]) -> "SessionState":
+        return cls(
+            context=payload["context"],
+            order=payload.get("order") or {},
+            latest_bill=payload.get("latest_bill"),
+            replies=payload.get("replies") or {},
+        )
+
+    @classmethod
+    def from_json(cls, data: str | bytes) -> "SessionState":
+        return cls.from_dict(json.loads(data))
+
+
+def _deep_sizeof(value: object) -> int:
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_sizeof(key) + _deep_sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_sizeof(item) for item in value)
+    elif isinstance(value, SessionState):
+        size += _deep_sizeof(value.__dict__)
+    return size
+
+
+# A turn loads its session once, runs the state machine on that private copy
+# and saves it once; backends never hand out objects another turn can mutate.
+class SessionStore(ABC):
+    backend = ""
+    # Backends doing network or disk I/O; async callers run turns on a worker thread for these.
+    blocking_io = False
+
+    def __init__(self, max_entries: int, idle_ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._sweeper: threading.Thread | None = None
+        self._sweeper_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.loads = 0
+        self.saves = 0
+
+    @abstractmethod
+    def load(self, session_id: str) -> SessionState | None: ...
+
+    @abstractmethod
+    def save(self, session_id: str, session: SessionState) -> None: ...
+
+    @abstractmethod
+    def scan(self) -> Iterator[SessionState]:
+        # Every live session, in no particular order; read-only.
+        ...
+
+    @contextmanager
+    def transaction(self, session_id: str) -> Iterator[None]:
+        # Makes load-then-save atomic against other processes sharing the backend;
+        # callers also hold the in-process per-session lock.
+        yield
+
+    def sweep(self) -> int:
+        return 0
+
+    def start_sweeper(self, interval_seconds: float) -> None:
+        with self._sweeper_lock:
+            if self._sweeper is not None or interval_seconds <= 0 or self.idle_ttl_seconds <= 0:
+                return
+            self._sweeper = threading.Thread(
+                target=self._sweep_forever, args=(interval_seconds,), name="session-sweeper", daemon=True
+            )
+            sweeper = self._sweeper
+        sweeper.start()
+
+    def _sweep_forever(self, interval_seconds: float) -> None:
+        while not self._stop.wait(interval_seconds):
+            try:
+                self.sweep()
+            except Exception:
+                # A transient backend error must not kill the sweeper thread.
+                pass
+
+    def stop_sweeper(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "backend": self.backend,
+            "max_entries": self.max_entries,
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+            "loads": self.loads,
+            "saves": self.saves,
+        }
+
+
+# In-process sessions kept in least-recently-used order. A session idle for
+# longer than idle_ttl_seconds is dropped on its next access or by the sweeper,
+# and the least recently used one is evicted once max_entries is reached.
+class MemorySessionStore(SessionStore):
+    backend = "memory"
+
+    def __init__(self, max_entries: int, idle_ttl_seconds: float) -> None:
+        super().__init__(max_entries, idle_ttl_seconds)
+        self._sessions: "OrderedDict[str, Tuple[float, SessionState]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self.sweeps = 0
+
+    def _is_expired(self, last_seen: float, now: float) -> bool:
+        return self.idle_ttl_seconds > 0 and now - last_seen > self.idle_ttl_seconds
+
+    def load(self, session_id: str) -> SessionState | None:
+        now = time.monotonic()
+        with self._lock:
+            self.loads += 1
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if self._is_expired(entry[0], now):
+                del self._sessions[session_id]
+                self.expired += 1
+                return None
+            self._sessions[session_id] = (now, entry[1])
+            self._sessions.move_to_end(session_id)
+            session = entry[1]
+        return copy.deepcopy(session)
+
+    def save(self, session_id: str, session: SessionState) -> None:
+        # The store takes ownership of the saved object; later loads return copies of it.
+        with self._lock:
+            self.saves += 1
+            if session_id not in self._sessions:
+                self.created += 1
+            self._sessions[session_id] = (time.monotonic(), session)
+            self._sessions.move_to_end(session_id)
+            while self.max_entries > 0 and len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+
+    def scan(self) -> Iterator[SessionState]:
+        now = time.monotonic()
+        with self._lock:
+            sessions = [
+                session for last_seen, session in self._sessions.values() if not self._is_expired(last_seen, now)
+            ]
+        # Stored sessions are replaced on save, never mutated, so they can be read after the lock is released.
+        return iter(sessions)
+
+    def sweep(self) -> int:
+        # Entries are in last-access order, so expired sessions form a prefix.
+        now = time.monotonic()
+        removed = 0
+        with self._lock:
+            while self._sessions:
+                session_id, (last_seen, _) = next(iter(self._sessions.items()))
+                if not self._is_expired(last_seen, now):
+                    break
+                del self._sessions[session_id]
+                removed += 1
+            self.expired += removed
+            self.sweeps += 1
+        return removed
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            count = len(self._sessions)
+            # Sizing every session would walk millions of dicts; extrapolate from the most recent ones.
+            sample: List[SessionState] = [
+                session for _, session in islice(reversed(self._sessions.values()), SIZE_SAMPLE)
+            ]
+            stats = super().stats()
+            stats.update({
+                "sessions": count,
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "sweeps": self.sweeps,
+            })
+        average = sum(_deep_sizeof(session) for session in sample) / len(sample) if sample else 0
+        stats["approx_bytes"] = int(average * count)
+        return stats
+
+
+# One row per session in a SQLite database shared by every worker on the host.
+# WAL mode lets readers proceed while a writer commits; expiry and the entry cap
+# are enforced by the sweeper using wall-clock timestamps.
+class SQLiteSessionStore(SessionStore):
+    backend = "sqlite"
+    blocking_io = True
+
+    def __init__(self, path: str, max_entries: int, idle_ttl_seconds: float) -> None:
+        super().__init__(max_entries, idle_ttl_seconds)
+        self.path = path
+        self._local = threading.local()
+        self.expired = 0
+        self.evicted = 0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shared across threads; each thread opens its own.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self, session_id: str) -> Iterator[None]:
+        # BEGIN IMMEDIATE takes the database write lock up front, so a concurrent
+        # turn in another worker waits instead of reading the pre-turn state.
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def load(self, session_id: str) -> SessionState | None:
+        self.loads += 1
+        row = self._connection().execute(
+            "SELECT state, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if self.idle_ttl_seconds > 0 and time.time() - row[1] > self.idle_ttl_seconds:
+            return None
+        return SessionState.from_json(row[0])
+
+    def save(self, session_id: str, session: SessionState) -> None:
+        self.saves += 1
+        self._connection().execute(
+            "INSERT INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+            (session_id, session.to_json(), time.time()),
+        )
+
+    def scan(self) -> Iterator[SessionState]:
+        # One short query per page: a streaming caller may resume on another
+        # thread, and each thread has its own connection.
+        cutoff = time.time() - self.idle_ttl_seconds if self.idle_ttl_seconds > 0 else 0.0
+        last = ""
+        while True:
+            rows = self._connection().execute(
+                "SELECT session_id, state FROM sessions WHERE session_id > ? AND updated_at >= ? "
+                "ORDER BY session_id LIMIT ?",
+                (last, cutoff, SCAN_PAGE_SIZE),
+            ).fetchall()
+            for _, state in rows:
+                yield SessionState.from_json(state)
+            if len(rows) < SCAN_PAGE_SIZE:
+                return
+            last = rows[-1][0]
+
+    def sweep(self) -> int:
+        connection = self._connection()
+        removed = 0
+        if self.idle_ttl_seconds > 0:
+            cursor = connection.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.idle_ttl_seconds,)
+            )
+            removed += cursor.rowcount
+            self.expired += cursor.rowcount
+        if self.max_entries > 0:
+            cursor = connection.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                "SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            removed += cursor.rowcount
+            self.evicted += cursor.rowcount
+        return removed
+
+    def stats(self) -> Dict[str, object]:
+        connection = self._connection()
+        page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        stats = super().stats()
+        stats.update({
+            "path": self.path,
+            "sessions": connection.execute("SELECT COUNT(*) FROM sessions").fetchone()[0],
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "approx_bytes": page_count * page_size,
+        })
+        return stats
+
+
+# One key per session in Redis (or anything speaking its protocol). Keys carry
+# the idle TTL, so Redis expires them itself; the entry cap is Redis's
+# maxmemory-policy (e.g. volatile-lru) rather than a count kept here.
+def _glob_escape(text: str) -> str:
+    # SCAN MATCH takes a glob pattern; the key prefix must match literally.
+    return "".join(f"\\{char}" if char in "*?[]\\" else char for char in text)
+
+
+class RedisSessionStore(SessionStore):
+    backend = "redis"
+    blocking_io = True
+    LOCK_TIMEOUT_SECONDS = 10
+
+    def __init__(self, client: object, max_entries: int, idle_ttl_seconds: float, key_prefix: str = "session:") -> None:
+        super().__init__(max_entries, idle_ttl_seconds)
+        self.client = client
+        self.key_prefix = key_prefix
+        # Session data and locks live in separate namespaces, so no session id
+        # (say "lock:abc") can name another session's lock or vice versa.
+        self.data_prefix = f"{key_prefix}data:"
+        self.lock_prefix = f"{key_prefix}lock:"
+
+    @classmethod
+    def from_url(cls, url: str, max_entries: int, idle_ttl_seconds: float, key_prefix: str) -> "RedisSessionStore":
+        if redis is None:
+            raise RuntimeError("SESSION_BACKEND=redis needs the 'redis' package installed.")
+        return cls(redis.Redis.from_url(url), max_entries, idle_ttl_seconds, key_prefix)
+
+    @contextmanager
+    def transaction(self, session_id: str) -> Iterator[None]:
+        # A per-session Redis lock (SET NX with expiry) serialises turns across
+        # instances; the expiry frees it if the holder dies mid-turn.
+        lock = self.client.lock(
+            self.lock_prefix + session_id,
+            timeout=self.LOCK_TIMEOUT_SECONDS,
+            blocking_timeout=self.LOCK_TIMEOUT_SECONDS,
+        )
+        if not lock.acquire():
+            raise TimeoutError(f"Session {session_id!r} is locked by another turn.")
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def load(self, session_id: str) -> SessionState | None:
+        self.loads += 1
+        data = self.client.get(self.data_prefix + session_id)
+        return SessionState.from_json(data) if data is not None else None
+
+    def save(self, session_id: str, session: SessionState) -> None:
+        self.saves += 1
+        ttl = int(self.idle_ttl_seconds) if self.idle_ttl_seconds > 0 else None
+        self.client.set(self.data_prefix + session_id, session.to_json(), ex=ttl)
+
+    def scan(self) -> Iterator[SessionState]:
+        keys: List[bytes] = []
+        pattern = _glob_escape(self.data_prefix) + "*"
+        for key in self.client.scan_iter(match=pattern, count=SCAN_PAGE_SIZE):
+            keys.append(key)
+            if len(keys) >= SCAN_PAGE_SIZE:
+                yield from self._load_many(keys)
+                keys = []
+        yield from self._load_many(keys)
+
+    def _load_many(self, keys: List[bytes]) -> Iterator[SessionState]:
+        if not keys:
+            return
+        for data in self.client.mget(keys):
+            # A key can expire between SCAN and MGET.
+            if data is not None:
+                yield SessionState.from_json(data)
+
+    def stats(self) -> Dict[str, object]:
+        stats = super().stats()
+        try:
+            stats["approx_bytes"] = int(self.client.info("memory").get("used_memory", 0))
+        except Exception as exc:
+            stats["error"] = str(exc)
+        return stats
+
+
+def create_session_store(
+    backend: str,
+    max_entries: int,
+    idle_ttl_seconds: float,
+    sqlite_path: str = "",
+    redis_url: str = "",
+    redis_key_prefix: str = "session:",
+) -> SessionStore:
+    if backend == "sqlite":
+        return SQLiteSessionStore(sqlite_path, max_entries, idle_ttl_seconds)
+    if backend == "redis":
+        return RedisSessionStore.from_url(redis_url, max_entries, idle_ttl_seconds, redis_key_prefix)
+    if backend != "memory":
+        raise ValueError(f"Unknown SESSION_BACKEND {backend!r}; expected one of {', '.join(SESSION_BACKENDS)}.")
+    return MemorySessionStore(max_entries, idle_ttl_seconds)
@@ -0,0 +1,98 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+import zlib
+from dataclasses import asdict
+from typing import Dict
+
+from app.session_store import SessionState
+
+TOKEN_VERSION = 1
+# 128-bit truncated HMAC-SHA256 keeps tokens short and is still infeasible to forge.
+SIGNATURE_BYTES = 16
+FLAG_RAW = b"r"
+FLAG_ZLIB = b"z"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+# Client-held session state: "<body>.<signature>", both base64url. The body is
+# a flag byte plus the JSON state, zlib-compressed when that is shorter. Tokens
+# are signed, not encrypted: the client can read its own cart and address but
+# cannot alter them. A token older than max_age_seconds starts a new session.
+class SessionTokenCodec:
+    def __init__(self, secret: str, max_age_seconds: float = 0, compress: bool = True) -> None:
+        if not secret:
+            raise RuntimeError("SESSION_BACKEND=token needs SESSION_TOKEN_SECRET shared by every instance.")
+        self._key = secret.encode("utf-8")
+        self.max_age_seconds = max_age_seconds
+        self.compress = compress
+        self.encoded = 0
+        self.decoded = 0
+        self.rejected = 0
+        self.expired = 0
+        self.encoded_bytes = 0
+
+    def _sign(self, body: bytes) -> bytes:
+        return hmac.new(self._key, body, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+    def encode(self, session: SessionState) -> str:
+        payload = json.dumps(
+            {"v": TOKEN_VERSION, "iat": int(time.time()), "s": asdict(session)}, separators=(",", ":")
+        ).encode("utf-8")
+        body = FLAG_RAW + payload
+        if self.compress:
+            packed = FLAG_ZLIB + zlib.compress(payload, 9)
+            if len(packed) < len(body):
+                body = packed
+
+        token = f"{_b64encode(body)}.{_b64encode(self._sign(body))}"
+        self.encoded += 1
+        self.encoded_bytes += len(token)
+        return token
+
+    def decode(self, token: str | None) -> SessionState | None:
+        if not token:
+            return None
+        try:
+            body_text, signature_text = token.split(".", 1)
+            body = _b64decode(body_text)
+            if not hmac.compare_digest(_b64decode(signature_text), self._sign(body)):
+                self.rejected += 1
+                return None
+
+            flag, payload = body[:1], body[1:]
+            if flag == FLAG_ZLIB:
+                payload = zlib.decompress(payload)
+            elif flag != FLAG_RAW:
+                raise ValueError("unknown token flag")
+            data = json.loads(payload)
+            if data.get("v") != TOKEN_VERSION:
+                raise ValueError("unsupported token version")
+        except (ValueError, zlib.error, UnicodeDecodeError):
+            self.rejected += 1
+            return None
+
+        if self.max_age_seconds > 0 and time.time() - data.get("iat", 0) > self.max_age_seconds:
+            self.expired += 1
+            return None
+        self.decoded += 1
+        return SessionState.from_dict(data["s"])
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "backend": "token",
+            "encoded": self.encoded,
+            "decoded": self.decoded,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "avg_token_bytes": round(self.encoded_bytes / self.encoded, 1) if self.encoded else 0.0,
+        }
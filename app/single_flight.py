@@ -0,0 +1,79 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+# Coalesces concurrent calls with the same key onto one execution; every caller
+# gets the leader's result or exception. Flights are concurrent.futures.Future
+# objects so sync (threadpool) and async (event loop) callers can share one.
+class SingleFlight:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, Future] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = Future()
+            self._flights[key] = flight
+            self.executions += 1
+            return flight, True
+
+    def _land(self, key: Hashable, flight: Future) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        flight, leader = self._join(key)
+        if not leader:
+            return flight.result()
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            self._land(key, flight)
+            flight.set_exception(exc)
+            raise
+        self._land(key, flight)
+        flight.set_result(result)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        flight, leader = self._join(key)
+        if leader:
+            # The call runs as its own task so a leader whose client disconnects
+            # does not cancel the answer the followers are waiting for.
+            task = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._finish(key, flight, done))
+            return await asyncio.shield(task)
+        return await asyncio.wrap_future(flight)
+
+    def _finish(self, key: Hashable, flight: Future, task: "asyncio.Future[T]") -> None:
+        self._land(key, flight)
+        if task.cancelled():
+            flight.set_exception(asyncio.CancelledError())
+        elif task.exception() is not None:
+            flight.set_exception(task.exception())
+        else:
+            flight.set_result(task.result())
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "coalescing_ratio": round(self.coalesced / self.calls, 4) if self.calls else 0.0,
+                "in_flight": len(self._flights),
+            }
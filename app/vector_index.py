@@ -0,0 +1,85 @@
+import zlib
+from typing import List, Sequence, Tuple
+
+from app.retrieval import TOKEN_PATTERN
+
+try:
+    import numpy as np
+except ImportError:  # Dense retrieval is optional; callers fall back to lexical ranking.
+    np = None
+
+DENSE_DIMENSIONS = 512
+NGRAM_SIZES = (3, 4)
+
+
+def dense_available() -> bool:
+    return np is not None
+
+
+def _hashed_features(text: str, dimensions: int) -> Tuple[List[int], List[float]]:
+    # Signed feature hashing over whole words and padded character n-grams, so
+    # spelling variants ("biriyani"/"biryani", "pizzas"/"pizza") share most features.
+    # crc32 keeps buckets stable across processes, unlike the salted built-in hash().
+    indices: List[int] = []
+    signs: List[float] = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        features = [f"w:{token}"]
+        padded = f" {token} "
+        for size in NGRAM_SIZES:
+            features.extend(padded[i : i + size] for i in range(len(padded) - size + 1))
+        for feature in features:
+            bucket = zlib.crc32(feature.encode("utf-8"))
+            indices.append(bucket % dimensions)
+            signs.append(1.0 if bucket & 0x80000000 else -1.0)
+    return indices, signs
+
+
+class HashingVectorizer:
+    def __init__(self, dimensions: int = DENSE_DIMENSIONS) -> None:
+        self.dimensions = dimensions
+
+    def transform(self, texts: Sequence[str]) -> "np.ndarray":
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            indices, signs = _hashed_features(text, self.dimensions)
+            if indices:
+                matrix[row] = np.bincount(indices, weights=signs, minlength=self.dimensions)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+# Unit-normalised document vectors in one contiguous float32 matrix; cosine
+# similarity for every document is a single matrix-vector product.
+class VectorIndex:
+    def __init__(self, documents: Sequence[str], vectorizer: HashingVectorizer | None = None) -> None:
+        self.vectorizer = vectorizer or HashingVectorizer()
+        self.matrix = np.ascontiguousarray(self.vectorizer.transform(documents))
+
+    @classmethod
+    def from_matrix(cls, matrix: "np.ndarray", vectorizer: HashingVectorizer) -> "VectorIndex":
+        # Wraps an already-built (possibly memory-mapped) matrix without re-embedding.
+        index = cls.__new__(cls)
+        index.vectorizer = vectorizer
+        index.matrix = matrix
+        return index
+
+    def embed(self, text: str) -> "np.ndarray":
+        return self.vectorizer.transform([text])[0]
+
+    def similarities(self, query: str) -> "np.ndarray":
+        return self.matrix @ self.embed(query)
+
+    def top_ids(self, query: str, top_k: int, min_similarity: float = 0.0) -> List[int]:
+        # Ids of the top_k documents above min_similarity, best first, ties in document order.
+        size = self.matrix.shape[0]
+        if size == 0 or top_k <= 0:
+            return []
+
+        scores = self.similarities(query)
+        if top_k < size:
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(size)
+        ordered = sorted(candidates.tolist(), key=lambda doc_id: (-scores[doc_id], doc_id))
+        return [doc_id for doc_id in ordered if scores[doc_id] > min_similarity]
@@ -0,0 +1,120 @@
+"""Grow a bill ledger to millions of rows and check that lookups stay flat.
+
+Bills are appended from several threads through the ledger's group-commit
+writer. At each checkpoint the script times lookups by bill_id, the newest bills
+of one session, and the first page of one day's bills, and prints the SQLite
+query plan to confirm each lookup is an index search rather than a scan.
+
+Usage: python scripts/bench_bill_ledger.py [--bills 1000000] [--checkpoints 10000,100000,1000000] [--path ledger.sqlite3]
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.bill_ledger import BillLedger  # noqa: E402
+
+SESSIONS = 50000
+START = datetime(2024, 1, 1)
+
+
+def _bill(number: int) -> Dict[str, object]:
+    issued_at = START + timedelta(seconds=number * 30)
+    return {
+        "bill_id": f"CN-{number:010d}",
+        "issued_at": issued_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "items": [{"name": "Margherita Pizza", "quantity": 2, "unit_price": 250, "line_total": 500}],
+        "subtotal": 500,
+        "gst": 25,
+        "total": 525,
+        "mode": "dine_in",
+        "slot": "8 PM",
+        "address": "",
+        "address_lines": [],
+    }
+
+
+def _append(ledger: BillLedger, first: int, last: int, threads: int) -> float:
+    def worker(offset: int) -> None:
+        for number in range(first + offset, last, threads):
+            ledger.append(f"session-{number % SESSIONS}", _bill(number))
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(offset,)) for offset in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    ledger.flush()
+    return time.perf_counter() - started
+
+
+def _p50_us(lookup: Callable[[], object], runs: int) -> float:
+    samples: List[float] = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        lookup()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bills", type=int, default=1000000)
+    parser.add_argument("--checkpoints", default="10000,100000,1000000")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--path", default="")
+    args = parser.parse_args()
+
+    path = args.path or str(Path(tempfile.mkdtemp()) / "bills.sqlite3")
+    ledger = BillLedger(path)
+    checkpoints = sorted({min(int(value), args.bills) for value in args.checkpoints.split(",")} | {args.bills})
+    connection = ledger._connection()
+    for label, sql, params in (
+        ("bill_id", "SELECT bill FROM bills WHERE bill_id = ?", ("CN-0000000001",)),
+        (
+            "session",
+            "SELECT bill FROM bills WHERE session_id = ? ORDER BY issued_at DESC, seq DESC LIMIT 50",
+            ("session-1",),
+        ),
+        (
+            "date range",
+            "SELECT issued_at, seq, bill FROM bills WHERE (issued_at, seq) > (?, ?) AND issued_at < ? "
+            "ORDER BY issued_at, seq LIMIT 500",
+            ("2024-01-02", 0, "2024-01-03"),
+        ),
+    ):
+        plan = " | ".join(row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + sql, params))
+        print(f"plan {label:10}: {plan}")
+
+    rng = random.Random(7)
+    total = 0
+    for checkpoint in checkpoints:
+        elapsed = _append(ledger, total, checkpoint, args.threads)
+        appended = checkpoint - total
+        total = checkpoint
+        stats = ledger.stats()
+        last_day = (START + timedelta(seconds=(total - 1) * 30)).strftime("%Y-%m-%d")
+
+        by_id = _p50_us(lambda: ledger.get(f"CN-{rng.randrange(total):010d}"), 2000)
+        by_session = _p50_us(lambda: ledger.for_session(f"session-{rng.randrange(min(total, SESSIONS))}", 50), 500)
+        by_day = _p50_us(lambda: list(islice(ledger.between(last_day, last_day), 50)), 200)
+        print(
+            f"{total:>9} bills  append {appended / elapsed:8.0f}/s (avg batch {stats['avg_batch']:6.1f})  "
+            f"get {by_id:6.1f} us  session {by_session:7.1f} us  day page {by_day:7.1f} us"
+        )
+    ledger.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Allocate invoice numbers from many processes at once and check the series stays sound.
+
+Each worker process opens its own allocator on one shared SQLite file, as separate
+app instances would, and confirms bills as fast as it can. The run is repeated for
+each block size: 1 takes the cross-process lock for every bill, larger blocks take
+it once per block, mostly on a background thread that reserves the next block
+ahead. Afterwards the script checks that no number was issued twice, that every
+worker's numbers only ever increase, and counts the numbers left unused (a worker
+that exits cleanly returns its unused blocks only while no later block was taken,
+so blocks reserved ahead by all but the last worker remain as gaps).
+
+Usage: python scripts/bench_invoice_numbers.py [--workers 16] [--bills 500] [--block-sizes 1,20,100]
+"""
+
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.invoice_numbers import InvoiceNumberAllocator  # noqa: E402
+
+
+def _confirm_bills(path: str, block_size: int, bills: int, start, results) -> None:
+    try:
+        allocator = InvoiceNumberAllocator(path, block_size)
+        start.wait()
+        numbers = [int(allocator.allocate().rsplit("-", 1)[1]) for _ in range(bills)]
+        allocator.release()
+        stats = allocator.stats()
+        results.put((numbers, stats["blocks_reserved"], stats["reserve_ms_max"]))
+    except Exception as exc:
+        # Reported instead of raised so the parent is not left waiting for this worker.
+        results.put(f"{type(exc).__name__}: {exc}")
+
+
+def _run(path: str, block_size: int, workers: int, bills: int) -> Tuple[List[List[int]], float, int, float]:
+    context = multiprocessing.get_context("spawn")
+    start = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(target=_confirm_bills, args=(path, block_size, bills, start, results)) for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    # Give every worker time to import and open the database before the race starts.
+    time.sleep(1.0)
+    started = time.perf_counter()
+    start.set()
+    collected = [results.get() for _ in processes]
+    wall = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    failures = [result for result in collected if isinstance(result, str)]
+    if failures:
+        sys.exit(f"{len(failures)} worker(s) failed: {failures[0]}")
+    return (
+        [numbers for numbers, _, _ in collected],
+        wall,
+        sum(blocks for _, blocks, _ in collected),
+        max(worst for _, _, worst in collected),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--bills", type=int, default=500, help="bills confirmed by each worker")
+    parser.add_argument("--block-sizes", default="1,20,100")
+    args = parser.parse_args()
+
+    print(f"workers={args.workers} bills/worker={args.bills}")
+    for block_size in (int(value) for value in args.block_sizes.split(",")):
+        path = str(Path(tempfile.mkdtemp()) / "invoice_numbers.sqlite3")
+        per_worker, wall, blocks, worst_ms = _run(path, block_size, args.workers, args.bills)
+        issued = [number for numbers in per_worker for number in numbers]
+        duplicates = len(issued) - len(set(issued))
+        monotonic = all(all(a < b for a, b in zip(numbers, numbers[1:])) for numbers in per_worker)
+        # Numbers below the highest one issued that nobody used.
+        gaps = max(issued) - len(set(issued))
+        summary: Dict[str, object] = {
+            "bills/s": round(len(issued) / wall),
+            "locks": blocks,
+            "worst lock ms": worst_ms,
+            "duplicates": duplicates,
+            "monotonic per worker": monotonic,
+            "gaps": gaps,
+        }
+        print(f"block={block_size:<4} " + "  ".join(f"{key} {value}" for key, value in summary.items()))
+        if duplicates or not monotonic:
+            sys.exit(f"invoice numbers broken with block size {block_size}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Measure invoice renders per second with and without the cached invoice template.
+
+"per-render logo" draws invoices the way they used to be drawn: drawImage gets the
+logo's file path, so every invoice reopens, decodes and embeds the full-size image,
+with ASCII85-encoded streams. "cached template" reuses the logo decoded and
+downscaled once per process and writes binary streams. A synthetic PNG logo is
+generated unless --logo points at a real one.
+
+Usage: python scripts/bench_invoice_render.py [--items 8] [--seconds 3] [--logo-px 1024] [--logo path.png]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def _synthetic_logo(size: int) -> str:
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for ring in range(0, size // 2, max(1, size // 32)):
+        draw.ellipse((ring, ring, size - ring, size - ring), outline=(ring % 255, 80, 160, 255), width=3)
+    path = Path(tempfile.mkdtemp()) / "logo.png"
+    image.save(path)
+    return str(path)
+
+
+def _sample_bill(items: int) -> Dict[str, object]:
+    rows = [
+        {"name": f"Menu Item {index}", "quantity": 1 + index % 3, "unit_price": 240, "line_total": 240 * (1 + index % 3)}
+        for index in range(items)
+    ]
+    subtotal = sum(int(row["line_total"]) for row in rows)
+    return {
+        "bill_id": "CN-BENCH01",
+        "issued_at": "2026-01-01 19:30:00",
+        "items": rows,
+        "subtotal": subtotal,
+        "gst": round(subtotal * 0.05),
+        "total": subtotal + round(subtotal * 0.05),
+        "mode": "delivery",
+        "slot": "",
+        "address": "12 MG Road, Bengaluru, 560001",
+        "address_lines": ["12 MG Road", "Bengaluru", "560001"],
+    }
+
+
+def _renders_per_second(render: Callable[[], bytes], seconds: float) -> Tuple[float, int]:
+    size = len(render())
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        render()
+        count += 1
+    return count / (time.perf_counter() - started), size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--logo-px", type=int, default=1024, help="side of the generated logo in pixels")
+    parser.add_argument("--logo", default="", help="use this image instead of a generated one")
+    args = parser.parse_args()
+
+    logo_path = args.logo or _synthetic_logo(args.logo_px)
+    # Config is read at import time, so the logo has to be set first.
+    os.environ["INVOICE_LOGO_PATH"] = logo_path
+
+    from reportlab import rl_config
+
+    from app.invoice_renderer import InvoiceTemplate, invoice_branding
+
+    bill = _sample_bill(args.items)
+    per_render = InvoiceTemplate(invoice_branding())
+    per_render.logo = logo_path
+    cached = InvoiceTemplate(invoice_branding())
+
+    print(f"logo={logo_path} items={args.items}")
+    baseline = 0.0
+    for label, template, ascii85 in (("per-render logo", per_render, 1), ("cached template", cached, 0)):
+        rl_config.useA85 = ascii85
+        rate, size = _renders_per_second(lambda: template.render(bill), args.seconds)
+        baseline = baseline or rate
+        print(
+            f"{label:16} {rate:8.1f} renders/s  {1000 / rate:6.2f} ms/render  "
+            f"{size / 1024:7.1f} KiB  x{rate / baseline:.1f}  {rate * 3600:10.0f}/hour"
+        )
+
+
+if __name__ == "__main__":
+    main()
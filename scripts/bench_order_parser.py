@@ -0,0 +1,101 @@
+"""Benchmark the single-pass order parser against the previous per-alias regex loop.
+
+Usage: python scripts/bench_order_parser.py [--items 1000 10000] [--order-size 50]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.rag_engine import MenuItem, _build_menu_catalog, _parse_order_from_query  # noqa: E402
+
+SYLLABLES = ["ka", "ri", "mo", "sa", "lu", "pe", "ta", "no", "vi", "de", "ra", "zu", "gho", "pan", "tik"]
+
+
+def _legacy_parse(query: str, alias_map: Dict[str, MenuItem]) -> Dict[str, int]:
+    q = query.lower()
+    order: Dict[str, int] = {}
+    for alias, item in alias_map.items():
+        alias_pattern = rf"\b{re.escape(alias)}\b"
+        if not re.search(alias_pattern, q):
+            continue
+        qty = 1
+        left = re.search(rf"(\d+)\s*(?:x\s*)?{alias_pattern}", q)
+        right = re.search(rf"{alias_pattern}\s*(?:x\s*)?(\d+)", q)
+        if left:
+            qty = int(left.group(1))
+        elif right:
+            qty = int(right.group(1))
+        order[item.name] = max(order.get(item.name, 0), qty)
+    return order
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+
+
+def _menu_lines(count: int, rng: random.Random) -> List[str]:
+    lines = ["Menu:"]
+    for idx in range(1, count + 1):
+        lines.append(f"{idx}. {_word(rng)} {_word(rng)} - Rs {rng.randint(50, 900)}")
+        lines.append("Ingredients: Spices")
+        lines.append("Type: Vegetarian")
+    lines.append("Policies:")
+    return lines
+
+
+def _party_order(names: List[str], size: int, rng: random.Random) -> str:
+    parts = []
+    for name in rng.sample(names, size):
+        words = name.split()
+        mention = rng.choice([name, words[0], words[-1]])
+        qty = rng.randint(1, 12)
+        parts.append(rng.choice([f"{qty} {mention}", f"{qty}x {mention}", f"{mention} x {qty}", mention]))
+    return "I want " + ", ".join(parts) + " please"
+
+
+def _time_per_call(fn, queries: List[str], repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            fn(query)
+    return (time.perf_counter() - started) / (repeat * len(queries))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--order-size", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    for count in args.items:
+        started = time.perf_counter()
+        catalog = _build_menu_catalog(_menu_lines(count, rng))
+        build_ms = (time.perf_counter() - started) * 1000
+
+        names = [item.name for item in catalog.items]
+        queries = [_party_order(names, min(args.order_size, len(names)), rng) for _ in range(args.queries)]
+        alias_map = dict(catalog.alias_map)
+
+        for query in queries:
+            assert _parse_order_from_query(query, catalog) == _legacy_parse(query, alias_map), query
+
+        new_s = _time_per_call(lambda q: _parse_order_from_query(q, catalog), queries, repeat=20)
+        legacy_s = _time_per_call(lambda q: _legacy_parse(q, alias_map), queries[:3], repeat=1)
+        print(
+            f"items={count:>6} aliases={len(alias_map):>6} catalog_build={build_ms:8.1f} ms  "
+            f"single_pass={new_s * 1e6:9.1f} us/query  legacy={legacy_s * 1e3:9.1f} ms/query  "
+            f"speedup={legacy_s / new_s:8.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
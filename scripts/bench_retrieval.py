@@ -0,0 +1,120 @@
+"""Benchmark indexed retrieve_context against the previous linear line scan.
+
+Also reports BM25 ranking latency (RETRIEVAL_MODE=bm25) over the same index.
+
+Usage: python scripts/bench_retrieval.py [--lines 100000] [--runs 200]
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.rag_engine import (  # noqa: E402
+    STOP_WORDS,
+    TOP_K_CONTEXT_LINES,
+    _build_knowledge_base,
+    _tokenize,
+    retrieve_context,
+)
+
+SYLLABLES = ["ka", "ri", "mo", "sa", "lu", "pe", "ta", "no", "vi", "de", "ra", "zu", "gho", "pan", "tik"]
+INGREDIENTS = ["Tomato", "Rice", "Chicken", "Paneer", "Spices", "Butter", "Cocoa", "Basil", "Garlic", "Lentils"]
+TYPES = ["Vegetarian", "Non-Vegetarian", "Vegan", "Dessert"]
+QUERIES = [
+    "is paneer tikka spicy",
+    "do you have parking",
+    "what time do you close on sunday",
+    "chocolate",
+    "vegan dishes with rice",
+    "home delivery",
+    "price of garlic",
+    "kari",
+]
+
+
+def _legacy_retrieve(lines: List[str], query: str, top_k: int) -> str:
+    query_tokens = [token for token in _tokenize(query) if token not in STOP_WORDS]
+    if not query_tokens:
+        return "\n".join(lines[:top_k])
+    scored = []
+    for idx, line in enumerate(lines):
+        line_tokens = set(_tokenize(line))
+        keyword_hits = sum(1 for token in query_tokens if token in line_tokens)
+        phrase_bonus = 2 if query.lower().strip() and query.lower().strip() in line.lower() else 0
+        score = keyword_hits + phrase_bonus
+        if score > 0:
+            scored.append((score, idx, line))
+    if not scored:
+        return "\n".join(lines[:top_k])
+    top_scored = sorted(scored, key=lambda item: (-item[0], item[1]))[:top_k]
+    return "\n".join(lines[i] for i in sorted({idx for _, idx, _ in top_scored}))
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+
+
+def _knowledge_base_text(line_count: int, rng: random.Random) -> str:
+    lines = ["Restaurant Name: Cloudnest", "Opening Hours:", "Monday-Sunday: 10 AM - 10 PM", "Menu:"]
+    idx = 1
+    while len(lines) < line_count - 3:
+        lines.append(f"{idx}. {_word(rng)} {_word(rng)} - Rs {rng.randint(50, 900)}")
+        lines.append(f"Ingredients: {', '.join(rng.sample(INGREDIENTS, 3))}")
+        lines.append(f"Type: {rng.choice(TYPES)}")
+        idx += 1
+    lines += ["Policies:", "- No outside food allowed", "- Home delivery available"]
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    text = _knowledge_base_text(args.lines, rng)
+
+    started = time.perf_counter()
+    kb = _build_knowledge_base(text, None, unit="line")
+    print(f"lines={len(kb.lines)} vocabulary={len(kb.index.postings)} "
+          f"snapshot_build={(time.perf_counter() - started) * 1000:.0f} ms")
+
+    for query in QUERIES:
+        started = time.perf_counter()
+        expected = _legacy_retrieve(kb.lines, query, TOP_K_CONTEXT_LINES)
+        legacy_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        assert retrieve_context(query, knowledge_base=kb) == expected, query
+        cold_us = (time.perf_counter() - started) * 1e6
+
+        samples = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            retrieve_context(query, knowledge_base=kb)
+            samples.append((time.perf_counter() - started) * 1e6)
+        samples.sort()
+
+        query_tokens = [token for token in _tokenize(query) if token not in STOP_WORDS]
+        bm25_samples = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            kb.index.bm25_top_ids(query_tokens, TOP_K_CONTEXT_LINES)
+            bm25_samples.append((time.perf_counter() - started) * 1e6)
+
+        print(
+            f"{query!r:36} indexed cold={cold_us:8.1f} us p50={statistics.median(samples):7.1f} us "
+            f"p95={samples[int(len(samples) * 0.95) - 1]:7.1f} us  bm25 p50={statistics.median(bm25_samples):7.1f} us  "
+            f"linear={legacy_ms:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
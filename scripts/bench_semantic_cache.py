@@ -0,0 +1,90 @@
+"""Report semantic answer-cache hit rate on paraphrases, false hits and lookup latency.
+
+Each pair stores the first question's answer under its retrieved context and then
+looks up the second question. Pairs marked distinct must not share an answer,
+including negated questions that score close to their positive form.
+
+Usage: python scripts/bench_semantic_cache.py [--threshold 0.8] [--entries 512]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.answer_cache import SemanticAnswerCache, context_hash  # noqa: E402
+from app.rag_engine import STOP_WORDS, knowledge_base_cache, retrieve_context  # noqa: E402
+from app.vector_index import HashingVectorizer  # noqa: E402
+
+# (stored question, incoming question, same answer expected)
+PAIRS = [
+    ("what time do you close", "when do you close", True),
+    ("when do you close", "closing time?", True),
+    ("what are your opening hours", "opening hours", True),
+    ("is paneer tikka spicy", "is the paneer tikka spicy?", True),
+    ("is biryani spicy", "is biriyani spicy", True),
+    ("do you have parking", "is there parking", True),
+    ("what is the price of pizza", "how much is pizza", True),
+    ("do you deliver", "do you do home delivery", True),
+    ("are you open on sunday", "are you open on monday", False),
+    ("is paneer tikka spicy", "is chicken tikka spicy", False),
+    ("is the pizza vegetarian", "is the biryani vegetarian", False),
+    ("is the paneer tikka spicy", "is the paneer tikka not spicy", False),
+    ("do you deliver to koramangala", "do you not deliver to koramangala", False),
+    ("is the biryani vegetarian", "isn't the biryani vegetarian", False),
+    ("do you have pizza with onion", "do you have pizza without onion", False),
+    ("is the brownie not too sweet", "is the brownie not very sweet", True),
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--entries", type=int, default=512)
+    args = parser.parse_args()
+
+    kb = knowledge_base_cache.get()
+    vectorizer = HashingVectorizer()
+    cache = SemanticAnswerCache(args.entries, 0, args.threshold, vectorizer, stop_words=STOP_WORDS)
+
+    true_hits = false_hits = expected_hits = 0
+    for stored, incoming, same in PAIRS:
+        cache.bind(("pair", stored, incoming))
+        stored_group = (context_hash(retrieve_context(stored, knowledge_base=kb)), "model")
+        incoming_group = (context_hash(retrieve_context(incoming, knowledge_base=kb)), "model")
+        cache.put(stored, stored_group, f"answer for {stored}")
+        hit = cache.lookup(incoming, incoming_group) is not None
+
+        expected_hits += same
+        true_hits += hit and same
+        false_hits += hit and not same
+        embeddings = vectorizer.transform([cache._embedding_text(stored), cache._embedding_text(incoming)])
+        print(
+            f"{stored!r:32} -> {incoming!r:30} similarity={float(embeddings[0] @ embeddings[1]):.2f} "
+            f"same_context={stored_group == incoming_group!s:5} hit={hit!s:5} expected={same}"
+        )
+
+    print(f"paraphrase hit rate={true_hits}/{expected_hits} false hits={false_hits}")
+
+    # Worst case for latency: a full cache where every entry shares one context.
+    cache.bind("latency")
+    group = ("context", "model")
+    for idx in range(args.entries):
+        cache.put(f"question number {idx} about dish {idx * 7}", group, "answer")
+    samples = []
+    for idx in range(2000):
+        started = time.perf_counter()
+        cache.lookup(f"question about dish {idx}", group)
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    print(
+        f"lookup over {args.entries} entries: p50={statistics.median(samples):.1f} us "
+        f"p95={samples[int(len(samples) * 0.95)]:.1f} us"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Hammer session state with parallel turns and check each turn is atomic.
+
+- Parallel "confirm" on one session (threads, then asyncio) must produce exactly one bill.
+- Parallel "add 1 margherita pizza" on one session must not lose a single update.
+- Parallel turns on distinct sessions report lock contention, which should stay near zero.
+
+Usage: python scripts/stress_session_turns.py [--backend memory|sqlite|redis] [--redis-url URL] [--workers 32] [--no-locks]
+
+The redis backend needs an explicit --redis-url, so a run never lands on a configured production instance.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def _prepare_cart(engine: object, session_id: str) -> None:
+    for question in ("dine in", "7:30 pm", "2 margherita pizza"):
+        engine.ask_question(question, session_id=session_id)
+
+
+def _parallel_confirms(engine: object, workers: int) -> List[Dict[str, object]]:
+    session_id = f"confirm-{time.time_ns()}"
+    _prepare_cart(engine, session_id)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda _: engine.ask_question("confirm", session_id=session_id), range(workers)))
+
+
+def _parallel_async_confirms(engine: object, workers: int) -> List[Dict[str, object]]:
+    session_id = f"confirm-async-{time.time_ns()}"
+    _prepare_cart(engine, session_id)
+
+    async def run() -> List[Dict[str, object]]:
+        return await asyncio.gather(
+            *(engine.ask_question_async("confirm", session_id=session_id) for _ in range(workers))
+        )
+
+    return asyncio.run(run())
+
+
+def _parallel_adds(engine: object, workers: int) -> int:
+    session_id = f"add-{time.time_ns()}"
+    _prepare_cart(engine, session_id)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda _: engine.ask_question("add 1 margherita pizza", session_id=session_id), range(workers)))
+    pending = engine.ask_question("order", session_id=session_id)
+    return int(pending["total"])
+
+
+def _unrelated_sessions(engine: object, workers: int, turns: int) -> float:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda idx: _prepare_cart(engine, f"solo-{idx}"), range(turns)))
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="memory", choices=["memory", "sqlite", "redis"])
+    parser.add_argument("--redis-url", help="Redis to run against with --backend redis (required for it)")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--no-locks", action="store_true", help="disable turn locking to show the races it prevents")
+    args = parser.parse_args()
+    if args.backend == "redis" and not args.redis_url:
+        parser.error("--backend redis needs --redis-url; SESSION_REDIS_URL is never used implicitly")
+
+    scratch = Path(tempfile.mkdtemp())
+    os.environ["SESSION_BACKEND"] = args.backend
+    # Sessions always go to scratch storage, never to a configured store.
+    os.environ["SESSION_SQLITE_PATH"] = str(scratch / "sessions.sqlite3")
+    if args.redis_url:
+        os.environ["SESSION_REDIS_URL"] = args.redis_url
+    os.environ["SESSION_REDIS_PREFIX"] = f"stress:{scratch.name}:"
+    # The fake bills go to a throwaway ledger; the real one is append-only.
+    os.environ["BILL_LEDGER_PATH"] = str(scratch / "bills.sqlite3")
+    # Likewise for invoice numbers: a stress run must not use up the real series.
+    os.environ["INVOICE_NUMBER_PATH"] = str(scratch / "invoice_numbers.sqlite3")
+    os.environ.pop("GEMINI_API_KEY", None)
+    # Switch threads far more often than the default 5 ms so interleavings actually happen.
+    sys.setswitchinterval(1e-6)
+
+    from app import rag_engine
+
+    if args.no_locks:
+        rag_engine.session_locks.hold = lambda session_id: nullcontext()
+        rag_engine.session_store.transaction = lambda session_id: nullcontext()
+
+    unit_price = rag_engine.knowledge_base_cache.get().menu.by_name["Margherita Pizza"].price
+    failures = 0
+    for round_id in range(args.rounds):
+        bills = sum(response["kind"] == "bill" for response in _parallel_confirms(rag_engine, args.workers))
+        async_bills = sum(response["kind"] == "bill" for response in _parallel_async_confirms(rag_engine, args.workers))
+        subtotal = _parallel_adds(rag_engine, args.workers)
+        expected = unit_price * (2 + args.workers)
+        ok = bills == 1 and async_bills == 1 and subtotal == expected
+        failures += not ok
+        if not ok:
+            print(
+                f"round {round_id}: bills={bills} async_bills={async_bills} "
+                f"subtotal={subtotal} expected={expected}"
+            )
+
+    locks_before = dict(rag_engine.session_locks.stats())
+    elapsed = _unrelated_sessions(rag_engine, args.workers, args.workers * 50)
+    locks_after = rag_engine.session_locks.stats()
+    print(f"backend={args.backend} locks={'off' if args.no_locks else 'on'} rounds={args.rounds} failures={failures}")
+    print(
+        f"unrelated sessions: {args.workers * 150} turns in {elapsed * 1000:.0f} ms, "
+        f"contended={locks_after['contended'] - locks_before['contended']} "
+        f"stripe_collisions={locks_after['stripe_collisions'] - locks_before['stripe_collisions']}"
+    )
+    print(f"lock totals: {locks_after}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()